@@ -0,0 +1,76 @@
+import numpy as np
+
+# Niveles de zoom del mapa con marcadores: por debajo de ZOOM_MAXIMO las zonas cercanas se agrupan y a partir
+# de ZOOM_MAXIMO se muestra cada zona por separado
+ZOOM_MINIMO = 4
+ZOOM_MAXIMO = 12
+
+# Radio (en píxeles de pantalla) dentro del cual se agrupan las zonas y tamaño de las teselas del mapa
+RADIO_AGRUPACION = 60
+TAMANO_TESELA = 256
+
+
+# Función para obtener el centro (latitud y longitud medias) y el valor medio de compra de cada zona de todas
+# las provincias. Las zonas sin coordenadas no se muestran.
+def centroides_zonas(df):
+    zonas = df.groupby(['prov_code', 'Ciudad']).agg({
+        'Latitud': 'mean',
+        'Longitud': 'mean',
+        'Valor medio de compra': 'mean',
+    })
+    return zonas.dropna(subset=['Latitud', 'Longitud']).reset_index()
+
+
+# Función para proyectar coordenadas geográficas al plano del mapa (Web Mercator, entre 0 y 1)
+def proyectar(latitud, longitud):
+    x = (np.asarray(longitud, dtype=float) + 180) / 360
+    seno = np.clip(np.sin(np.radians(np.asarray(latitud, dtype=float))), -0.9999, 0.9999)
+    y = 0.5 - np.log((1 + seno) / (1 - seno)) / (4 * np.pi)
+    return x, y
+
+
+# Función inversa de proyectar
+def desproyectar(x, y):
+    longitud = np.asarray(x) * 360 - 180
+    latitud = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y)))))
+    return latitud, longitud
+
+
+# Función para agrupar jerárquicamente las zonas para cada nivel de zoom. Se parte de las zonas sueltas en
+# ZOOM_MAXIMO y cada nivel agrupa los grupos del nivel siguiente que caen en la misma celda de la rejilla
+# (del tamaño del radio de agrupación a ese zoom), así que un grupo siempre contiene grupos completos del
+# nivel con más zoom. Para cada nivel se devuelve el grupo de cada zona y el centro de cada grupo.
+def agrupar_zonas(latitud, longitud, zoom_minimo=ZOOM_MINIMO, zoom_maximo=ZOOM_MAXIMO, radio=RADIO_AGRUPACION):
+    x, y = proyectar(latitud, longitud)
+    etiquetas = np.arange(len(x))
+    niveles = {}
+    for zoom in range(zoom_maximo, zoom_minimo - 1, -1):
+        if zoom < zoom_maximo and len(x):
+            # Centro de cada grupo del nivel anterior (media de sus zonas) y celda de la rejilla en la que cae
+            cuentas = np.bincount(etiquetas)
+            centro_x = np.bincount(etiquetas, weights=x) / cuentas
+            centro_y = np.bincount(etiquetas, weights=y) / cuentas
+            celda = radio / (TAMANO_TESELA * 2 ** zoom)
+            celdas = np.column_stack([np.floor(centro_x / celda), np.floor(centro_y / celda)])
+            _, grupos = np.unique(celdas, axis=0, return_inverse=True)
+            etiquetas = grupos.ravel()[etiquetas]
+
+        cuentas = np.bincount(etiquetas, minlength=etiquetas.max() + 1 if len(etiquetas) else 0)
+        centros = desproyectar(np.bincount(etiquetas, weights=x) / np.maximum(cuentas, 1),
+                               np.bincount(etiquetas, weights=y) / np.maximum(cuentas, 1))
+        niveles[zoom] = {
+            'etiquetas': etiquetas.tolist(),
+            'centros': np.round(np.column_stack(centros), 5).tolist(),
+        }
+    return niveles
+
+
+# Función para preparar los puntos que se envían al mapa (una sola vez por versión de los datos): nombre y
+# posición de cada zona y sus grupos en cada nivel de zoom
+def puntos_zonas(centroides):
+    return {
+        'zonas': centroides['Ciudad'].astype(str).tolist(),
+        'zoom_minimo': ZOOM_MINIMO,
+        'zoom_maximo': ZOOM_MAXIMO,
+        'niveles': agrupar_zonas(centroides['Latitud'].to_numpy(), centroides['Longitud'].to_numpy()),
+    }
@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import recursos
+from cache_compartida import cache_resultados
+from particiones import PROVINCIA_POR_DEFECTO
+from perfiles import evaluar_actualizacion
+
+# Script de la aplicación y puerto en el que se publica el estado de preparación para el balanceador de carga
+SCRIPT_APLICACION = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'herramienta.py')
+PUERTO_PREPARACION = int(os.environ.get('TFM_PUERTO_PREPARACION', 8502))
+
+# Valores por defecto del formulario, para precalentar lo que verá el primer usuario
+INGRESOS_POR_DEFECTO = 1000
+TIPOS_VIVIENDA = ["Nueva", "Segunda mano"]
+
+# Cachés cuyo contenido se comprueba al terminar el precalentamiento
+CACHES = [recursos.cache_global, recursos.cache_recursos, cache_resultados]
+
+# Estado del precalentamiento, consultado por el balanceador de carga
+estado_arranque = {
+    'listo': False,
+    'error': None,
+    'avisos': [],
+    'pasos': [],
+    'inicio': None,
+    'duracion': None,
+}
+
+
+# Función para registrar un paso completado del precalentamiento
+def registrar_paso(nombre):
+    estado_arranque['pasos'].append(nombre)
+
+
+# Función para anotar un fallo que no impide que la réplica esté lista
+def registrar_aviso(mensaje):
+    estado_arranque['avisos'].append(mensaje)
+    print(mensaje, file=sys.stderr)
+
+
+# Función para obtener la provincia de una clave de caché (None si el recurso no depende de la provincia)
+def provincia_clave(clave):
+    return dict(clave[2:]).get('provincia')
+
+
+# Función para precalcular los recursos de una provincia con los valores por defecto del formulario
+def precalentar_provincia(prov_code):
+    df = recursos.obtener_datos_provincia(prov_code)
+    recursos.obtener_zonas_mapa(prov_code)
+    registrar_paso(f'datos_{prov_code}')
+    if df.empty:
+        return
+
+    recursos.obtener_geometrias_mapa(prov_code)
+    recursos.obtener_viabilidad_mapa(prov_code, INGRESOS_POR_DEFECTO)
+    recursos.obtener_capa_segmentos(prov_code)
+    recursos.obtener_riesgo_tipos(prov_code, INGRESOS_POR_DEFECTO)
+    recursos.obtener_estado_zonas(prov_code)
+
+    # Gráficos y alternativas de la zona que aparece seleccionada por defecto
+    zona_por_defecto = df['Ciudad'].unique()[0]
+    recursos.obtener_figura_tendencia(prov_code, zona_por_defecto)
+    recursos.obtener_figura_distribucion(prov_code, zona_por_defecto)
+    for tipo_vivienda in TIPOS_VIVIENDA:
+        recursos.obtener_figura_comparativo(prov_code, tipo_vivienda)
+        recursos.obtener_recomendaciones(prov_code, tipo_vivienda, INGRESOS_POR_DEFECTO)
+        recursos.obtener_figura_evolucion_viabilidad(prov_code, tipo_vivienda, INGRESOS_POR_DEFECTO)
+        recursos.obtener_zonas_similares(prov_code, zona_por_defecto, tipo_vivienda, INGRESOS_POR_DEFECTO)
+    registrar_paso(f'graficos_{prov_code}')
+
+
+# Función para precalcular y guardar en caché los artefactos que necesita la aplicación
+def precalentar():
+    estado_arranque['inicio'] = time.time()
+    for cache in CACHES:
+        cache.anotar_consultas()
+    try:
+        indice = recursos.obtener_indice()
+        registrar_paso('indice')
+
+        # Con la memoria compartida, la primera réplica genera los archivos mapeables y el resto solo los abre
+        if recursos.USAR_MEMORIA_COMPARTIDA:
+            recursos.obtener_memoria()
+            registrar_paso('memoria')
+
+        recursos.indice_ingresos.actualizar()
+        registrar_paso('historial')
+
+        recursos.obtener_segmentos()
+        registrar_paso('segmentos')
+
+        # Grupos de los marcadores de todas las zonas para el mapa a escala nacional
+        recursos.obtener_puntos_zonas()
+        recursos.obtener_viabilidad_puntos(INGRESOS_POR_DEFECTO)
+        registrar_paso('puntos')
+
+        # Avisar a los perfiles guardados si los datos han cambiado desde la última evaluación. Un fallo aquí no
+        # impide atender peticiones: se anota y la evaluación se repite en el próximo arranque.
+        try:
+            evaluar_actualizacion(recursos.almacen_perfiles, indice)
+            registrar_paso('perfiles')
+        except Exception as e:
+            registrar_aviso(f"Error al evaluar los perfiles guardados: {type(e).__name__}: {e}")
+
+        # Solo caben PROVINCIAS_EN_MEMORIA provincias: se precalientan las primeras y la provincia por defecto
+        # al final, para que sea la última en expulsarse
+        otras = [prov_code for prov_code in indice['provincias'] if prov_code != PROVINCIA_POR_DEFECTO]
+        provincias = otras[:recursos.PROVINCIAS_EN_MEMORIA - 1]
+        if PROVINCIA_POR_DEFECTO in indice['provincias']:
+            provincias.append(PROVINCIA_POR_DEFECTO)
+        for prov_code in provincias:
+            precalentar_provincia(prov_code)
+
+        # Solo se informa de que la réplica está lista si los recursos globales y los de la provincia por defecto
+        # siguen en las cachés (si no caben, la primera petición volvería a cargarlos)
+        ultima = provincias[-1] if provincias else None
+        faltan = [
+            clave for cache in CACHES for clave in cache.consultadas_expulsadas()
+            if provincia_clave(clave) in (None, ultima)
+        ]
+        if faltan:
+            raise RuntimeError(f"Las cachés no tienen capacidad para los recursos precalentados: faltan {len(faltan)} "
+                               f"(por ejemplo, {faltan[0]})")
+
+        estado_arranque['listo'] = True
+    except Exception as e:
+        estado_arranque['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        for cache in CACHES:
+            cache.consultadas_expulsadas()
+        estado_arranque['duracion'] = time.time() - estado_arranque['inicio']
+
+
+# Servidor HTTP mínimo que responde 200 cuando las cachés están listas y 503 mientras tanto
+class ManejadorPreparacion(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/preparado'):
+            self.send_error(404)
+            return
+
+        cuerpo = json.dumps(estado_arranque).encode('utf-8')
+        self.send_response(200 if estado_arranque['listo'] else 503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+# Función para lanzar el precalentamiento y el servidor de preparación en hilos en segundo plano
+def iniciar(puerto=PUERTO_PREPARACION):
+    threading.Thread(target=precalentar, name='precalentamiento', daemon=True).start()
+    servidor = ThreadingHTTPServer(('', puerto), ManejadorPreparacion)
+    threading.Thread(target=servidor.serve_forever, name='preparacion', daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    # Se ejecuta Streamlit en este mismo proceso para que la aplicación use las cachés precalentadas
+    from streamlit.web import cli
+
+    iniciar()
+    sys.argv = ['streamlit', 'run', SCRIPT_APLICACION] + sys.argv[1:]
+    sys.exit(cli.main())
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Número máximo de resultados guardados en la caché compartida
+CAPACIDAD_CACHE = 256
+
+
+# Función para normalizar los valores de entrada de una clave de caché
+def normalizar_valor(valor):
+    if isinstance(valor, str):
+        return valor.strip()
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, float):
+        return round(valor, 2)
+    return valor
+
+
+# Función para construir la clave de un resultado a partir de sus entradas normalizadas y la versión de los datos
+def clave_cache(nombre, version_datos, **entradas):
+    return (nombre, version_datos) + tuple(sorted((clave, normalizar_valor(valor)) for clave, valor in entradas.items()))
+
+
+# Caché LRU acotada y compartida entre sesiones. Si varias sesiones piden a la vez una clave que no está
+# en la caché, solo la primera la calcula y el resto espera a ese mismo resultado.
+class CacheCompartida:
+    def __init__(self, capacidad=CAPACIDAD_CACHE):
+        self.capacidad = capacidad
+        self.entradas = OrderedDict()
+        self.en_curso = {}
+        self.bloqueo = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.esperas = 0
+        self.expulsiones = 0
+        self.consultadas = None
+
+    # Función para obtener un resultado de la caché o calcularlo si no está
+    def obtener(self, clave, calcular):
+        with self.bloqueo:
+            if self.consultadas is not None:
+                self.consultadas.add(clave)
+            if clave in self.entradas:
+                self.entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self.entradas[clave]
+
+            calculo = self.en_curso.get(clave)
+            propietario = calculo is None
+            if propietario:
+                calculo = Future()
+                self.en_curso[clave] = calculo
+                self.fallos += 1
+            else:
+                self.esperas += 1
+
+        if not propietario:
+            return calculo.result()
+
+        try:
+            valor = calcular()
+        except BaseException as e:
+            with self.bloqueo:
+                del self.en_curso[clave]
+            calculo.set_exception(e)
+            raise
+
+        with self.bloqueo:
+            self.entradas[clave] = valor
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+                self.expulsiones += 1
+            del self.en_curso[clave]
+        calculo.set_result(valor)
+        return valor
+
+    # Función para empezar a anotar las claves consultadas (el precalentamiento comprueba después que siguen en
+    # la caché)
+    def anotar_consultas(self):
+        with self.bloqueo:
+            self.consultadas = set()
+
+    # Función para dejar de anotar las claves consultadas y obtener las que ya no están en la caché
+    def consultadas_expulsadas(self):
+        with self.bloqueo:
+            consultadas, self.consultadas = self.consultadas or set(), None
+            return {clave for clave in consultadas if clave not in self.entradas}
+
+    # Función para obtener las métricas de uso de la caché
+    def metricas(self):
+        with self.bloqueo:
+            consultas = self.aciertos + self.fallos + self.esperas
+            return {
+                'entradas': len(self.entradas),
+                'capacidad': self.capacidad,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'esperas': self.esperas,
+                'expulsiones': self.expulsiones,
+                'tasa_aciertos': (self.aciertos + self.esperas) / consultas if consultas else 0.0,
+            }
+
+
+# Caché de resultados compartida por todas las sesiones del proceso
+cache_resultados = CacheCompartida()
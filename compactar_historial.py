@@ -0,0 +1,169 @@
+import argparse
+import glob
+import os
+
+import pandas as pd
+
+from datos import HISTORICAL_FILE, bloquear_historial
+
+# Directorio con el historial compactado: búsquedas originales comprimidas y particionadas por mes,
+# y agregados diarios y semanales por zona y tramo de ingresos
+DIRECTORIO_HISTORIAL = 'historial'
+DIRECTORIO_CRUDO = 'crudo'
+PARTICION_SIN_FECHA = 'sin_fecha'
+ARCHIVOS_AGREGADOS = {'diario': 'agregados_diarios.csv', 'semanal': 'agregados_semanales.csv'}
+
+# Días de búsquedas que se mantienen sin compactar en el historial activo
+RETENCION_DIAS = 30
+
+# Tramos de ingresos anuales usados en los agregados
+LIMITES_TRAMOS = [0, 15000, 25000, 35000, 50000, 75000, 100000, float('inf')]
+NOMBRES_TRAMOS = ['<15k', '15k-25k', '25k-35k', '35k-50k', '50k-75k', '75k-100k', '>100k']
+
+
+# Función para leer el historial con la fecha de cada búsqueda (las búsquedas antiguas pueden no tenerla)
+def leer_historial(ruta):
+    historico = pd.read_csv(ruta)
+    if 'Fecha' not in historico.columns:
+        historico['Fecha'] = pd.NaT
+    historico['Fecha'] = pd.to_datetime(historico['Fecha'], errors='coerce')
+    return historico
+
+
+# Función para calcular la fecha a partir de la cual las búsquedas se mantienen en el historial activo.
+# Se alinea al inicio de semana para que los días y semanas compactados estén siempre completos.
+def fecha_corte(ahora, retencion_dias):
+    corte = (pd.Timestamp(ahora) - pd.Timedelta(days=retencion_dias)).normalize()
+    return corte - pd.Timedelta(days=corte.weekday())
+
+
+# Función para asignar el periodo (día o semana) de cada búsqueda
+def periodo(fechas, granularidad):
+    if granularidad == 'diario':
+        return fechas.dt.normalize()
+    return fechas.dt.normalize() - pd.to_timedelta(fechas.dt.weekday, unit='D')
+
+
+# Función para calcular los agregados por periodo, zona y tramo de ingresos
+def agregar(historico, granularidad):
+    datos = historico.assign(
+        Periodo=periodo(historico['Fecha'], granularidad),
+        Tramo=pd.cut(historico['Ingresos'], LIMITES_TRAMOS, labels=NOMBRES_TRAMOS, right=False).astype(str),
+    )
+    agregados = datos.groupby(['Periodo', 'Zona', 'Tramo'], dropna=False).agg(
+        Busquedas=('Ingresos', 'size'),
+        Ingresos_p25=('Ingresos', lambda x: x.quantile(0.25)),
+        Ingresos_p50=('Ingresos', 'median'),
+        Ingresos_p75=('Ingresos', lambda x: x.quantile(0.75)),
+        Valor_medio_compra=('Valor medio de compra', 'mean'),
+        Precio_medio_m2=('Precio medio/m²', 'mean'),
+    ).reset_index()
+    return agregados
+
+
+# Función para obtener la partición (año y mes) en la que se archiva cada búsqueda
+def particion(fechas):
+    return fechas.dt.strftime('anio=%Y/mes=%m').fillna(PARTICION_SIN_FECHA)
+
+
+# Función para leer las búsquedas archivadas de unas particiones
+def leer_archivo(directorio, particiones=None):
+    rutas = []
+    for nombre in (particiones if particiones is not None else ['**']):
+        rutas += glob.glob(os.path.join(directorio, DIRECTORIO_CRUDO, nombre, '*.csv.gz'), recursive=True)
+    if not rutas:
+        return None
+    archivado = pd.concat([pd.read_csv(ruta) for ruta in sorted(set(rutas))], ignore_index=True)
+    archivado['Fecha'] = pd.to_datetime(archivado['Fecha'], errors='coerce')
+    return archivado
+
+
+# Función para leer los agregados ya calculados
+def leer_agregados(directorio, granularidad):
+    ruta = os.path.join(directorio, ARCHIVOS_AGREGADOS[granularidad])
+    if not os.path.exists(ruta):
+        return None
+    agregados = pd.read_csv(ruta)
+    agregados['Periodo'] = pd.to_datetime(agregados['Periodo'], errors='coerce')
+    return agregados
+
+
+# Función para compactar las búsquedas anteriores al periodo de retención
+def compactar(ruta=HISTORICAL_FILE, directorio=DIRECTORIO_HISTORIAL, retencion_dias=RETENCION_DIAS, ahora=None):
+    corte = fecha_corte(ahora if ahora is not None else pd.Timestamp.now(), retencion_dias)
+
+    with bloquear_historial(ruta):
+        historico = leer_historial(ruta)
+        antiguas = historico['Fecha'].isna() | (historico['Fecha'] < corte)
+        compactadas = historico[antiguas]
+        if compactadas.empty:
+            return 0
+
+        # Archivar las búsquedas originales comprimidas, en un archivo nuevo por mes y ejecución
+        sello = pd.Timestamp.now().strftime('%Y%m%dT%H%M%S%f')
+        particiones = particion(compactadas['Fecha'])
+        for nombre, grupo in compactadas.groupby(particiones):
+            os.makedirs(os.path.join(directorio, DIRECTORIO_CRUDO, nombre), exist_ok=True)
+            grupo.to_csv(
+                os.path.join(directorio, DIRECTORIO_CRUDO, nombre, f'busquedas-{sello}.csv.gz'),
+                index=False, compression='gzip'
+            )
+
+        # Recalcular los agregados de los periodos afectados a partir de todo lo archivado en sus meses,
+        # para que sean exactos aunque un periodo reciba búsquedas en varias compactaciones
+        archivado = leer_archivo(directorio, sorted(particiones.unique()))
+        for granularidad, archivo in ARCHIVOS_AGREGADOS.items():
+            nuevos = agregar(archivado, granularidad)
+            periodos_afectados = set(periodo(compactadas['Fecha'], granularidad).dropna())
+            nuevos = nuevos[nuevos['Periodo'].isin(periodos_afectados) | nuevos['Periodo'].isna()]
+            anteriores = leer_agregados(directorio, granularidad)
+            if anteriores is not None:
+                conservar = ~anteriores['Periodo'].isin(periodos_afectados)
+                if compactadas['Fecha'].isna().any():
+                    conservar &= anteriores['Periodo'].notna()
+                nuevos = pd.concat([anteriores[conservar], nuevos], ignore_index=True)
+            nuevos.sort_values(['Periodo', 'Zona', 'Tramo'], na_position='first').to_csv(
+                os.path.join(directorio, archivo), index=False, date_format='%Y-%m-%d'
+            )
+
+        # Reescribir el historial activo solo con las búsquedas recientes (de forma atómica). Con el bloqueo
+        # puesto ningún proceso ha podido añadir búsquedas, así que se quitan las antiguas del archivo tal cual.
+        recientes = pd.read_csv(ruta)[~antiguas.to_numpy()]
+        temporal = f'{ruta}.tmp'
+        recientes.to_csv(temporal, index=False)
+        os.replace(temporal, ruta)
+    return len(compactadas)
+
+
+# Función para consultar la evolución de las búsquedas combinando los agregados y el historial activo
+def tendencia_busquedas(zona=None, granularidad='semanal', ruta=HISTORICAL_FILE, directorio=DIRECTORIO_HISTORIAL):
+    partes = []
+    agregados = leer_agregados(directorio, granularidad)
+    if agregados is not None:
+        partes.append(agregados)
+    if os.path.exists(ruta):
+        historico = leer_historial(ruta)
+        if not historico.empty:
+            partes.append(agregar(historico, granularidad))
+    if not partes:
+        return pd.DataFrame(columns=['Periodo', 'Busquedas', 'Ingresos_p50'])
+
+    tendencia = pd.concat(partes, ignore_index=True).dropna(subset=['Periodo'])
+    if zona is not None:
+        tendencia = tendencia[tendencia['Zona'] == zona]
+    # La mediana de ingresos del periodo se aproxima con la media de las medianas ponderada por búsquedas
+    tendencia = tendencia.assign(Ponderado=tendencia['Ingresos_p50'] * tendencia['Busquedas'])
+    resumen = tendencia.groupby('Periodo').agg(Busquedas=('Busquedas', 'sum'), Ponderado=('Ponderado', 'sum'))
+    resumen['Ingresos_p50'] = resumen['Ponderado'] / resumen['Busquedas']
+    return resumen.drop(columns='Ponderado').reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compacta las búsquedas antiguas del historial en agregados.")
+    parser.add_argument('--retencion', type=int, default=RETENCION_DIAS,
+                        help="Días de búsquedas que se mantienen sin compactar")
+    parser.add_argument('--directorio', default=DIRECTORIO_HISTORIAL, help="Directorio del historial compactado")
+    args = parser.parse_args()
+
+    compactadas = compactar(directorio=args.directorio, retencion_dias=args.retencion)
+    print(f"Búsquedas compactadas: {compactadas}")
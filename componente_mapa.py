@@ -0,0 +1,52 @@
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+# Componente de Streamlit que dibuja el mapa de zonas en el navegador
+_mapa_zonas = components.declare_component(
+    'mapa_zonas',
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'componentes', 'mapa_zonas')
+)
+
+
+# Función para decidir si hay que enviar unos datos estáticos del mapa (geometrías o puntos): solo se envían
+# la primera vez que la sesión los ve o si el navegador los pide porque ha perdido el mapa
+def datos_por_enviar(key, tipo, identificador):
+    clave_enviados = f'{key}_envio_{tipo}'
+    clave_peticion = f'{key}_peticion_{tipo}'
+
+    respuesta = st.session_state.get(key)
+    if (respuesta and respuesta.get(f'necesita_{tipo}') == identificador
+            and respuesta.get('peticion') != st.session_state.get(clave_peticion)):
+        st.session_state[clave_peticion] = respuesta.get('peticion')
+        st.session_state.pop(clave_enviados, None)
+    return identificador is not None and st.session_state.get(clave_enviados) != identificador
+
+
+# Función para mostrar el mapa de zonas. Las geometrías solo se envían la primera vez que la sesión ve una
+# provincia (o si el navegador las pide porque ha perdido el mapa); en el resto de re-ejecuciones solo se
+# envía la capa a mostrar (el código de cada zona con sus colores y leyenda, ver mapa.capa_viabilidad).
+# Opcionalmente se superponen los marcadores de los centros de las zonas de todas las provincias: sus grupos
+# por nivel de zoom se envían igual que las geometrías y en cada re-ejecución solo su capa (capa_puntos).
+def mapa_zonas(id_geometrias, obtener_geometrias, capa, centro, limites, alto, id_puntos=None, obtener_puntos=None,
+               capa_puntos=None, key='mapa_zonas'):
+    enviar_geometrias = datos_por_enviar(key, 'geometrias', id_geometrias)
+    enviar_puntos = capa_puntos is not None and datos_por_enviar(key, 'puntos', id_puntos)
+    _mapa_zonas(
+        id_geometrias=id_geometrias,
+        geometrias=obtener_geometrias() if enviar_geometrias else None,
+        capa=capa,
+        id_puntos=id_puntos if capa_puntos is not None else None,
+        puntos=obtener_puntos() if enviar_puntos else None,
+        capa_puntos=capa_puntos,
+        centro=centro,
+        limites=limites,
+        alto=alto,
+        key=key,
+        default=None
+    )
+    if enviar_geometrias:
+        st.session_state[f'{key}_envio_geometrias'] = id_geometrias
+    if enviar_puntos:
+        st.session_state[f'{key}_envio_puntos'] = id_puntos
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Archivo con los resúmenes de cuantiles del precio por m² generados en la ingesta de transacciones
+ARCHIVO_CUANTILES = 'cuantiles_vivienda.csv'
+
+# Resúmenes de cuantiles con error relativo acotado: cada valor se cuenta en un cubo logarítmico, de modo que
+# cualquier cuantil se obtiene con un error relativo máximo de ERROR_RELATIVO. Los resúmenes de varios bloques,
+# años o zonas se combinan sumando las cuentas de cada cubo.
+ERROR_RELATIVO = 0.01
+GAMMA = (1 + ERROR_RELATIVO) / (1 - ERROR_RELATIVO)
+
+# Claves de los resúmenes que se mantienen
+CLAVES_CUANTILES = ['Ciudad', 'Tipo de vivienda', 'Año']
+
+# Percentiles que se muestran como indicadores
+PERCENTILES = [10, 25, 50, 75, 90]
+
+# Columnas del resumen de la distribución (también cuando la zona no tiene ningún precio válido)
+COLUMNAS_RESUMEN = (['Tipo de vivienda', 'Observaciones', 'q1', 'mediana', 'q3', 'minimo', 'maximo']
+                    + [f'P{percentil}' for percentil in PERCENTILES])
+
+
+# Función para obtener el cubo logarítmico de cada valor (solo valores positivos)
+def cubos(valores):
+    return np.ceil(np.log(np.asarray(valores, dtype=float)) / np.log(GAMMA)).astype(np.int64)
+
+
+# Función para obtener el valor representativo de cada cubo (con error relativo inferior a ERROR_RELATIVO)
+def valor_cubo(cubo):
+    return 2 * GAMMA ** np.asarray(cubo, dtype=float) / (GAMMA + 1)
+
+
+# Función para construir los resúmenes de cuantiles de una columna por zona, tipo de vivienda y año
+def construir_cuantiles(df, columna='Precio medio/m²'):
+    datos = df[CLAVES_CUANTILES + [columna]].dropna()
+    datos = datos[datos[columna] > 0]
+    return (datos.assign(Cubo=cubos(datos[columna]))
+            .groupby(CLAVES_CUANTILES + ['Cubo']).size().rename('Cuenta').reset_index())
+
+
+# Función para combinar resúmenes de cuantiles, quedándose solo con las claves indicadas
+def combinar_cuantiles(tabla, claves=CLAVES_CUANTILES):
+    return tabla.groupby(list(claves) + ['Cubo'], sort=True)['Cuenta'].sum().reset_index()
+
+
+# Función para leer los resúmenes de cuantiles generados en la ingesta (None si no existen)
+def leer_cuantiles(ruta=ARCHIVO_CUANTILES):
+    if not os.path.exists(ruta):
+        return None
+    return pd.read_csv(ruta, sep=';', dtype={'Cubo': np.int64, 'Cuenta': np.int64})
+
+
+# Función para obtener los resúmenes de cuantiles de las zonas de una provincia: los generados en la ingesta de
+# transacciones (ya separados por provincia, ver particiones.cargar_cuantiles_provincia) si existen y, si no,
+# los calculados a partir de las filas de su dataset
+def cuantiles_dataset(df, tabla=None):
+    if tabla is None:
+        return construir_cuantiles(df)
+    return tabla
+
+
+# Función para calcular cuantiles (probabilidades entre 0 y 1) a partir de un resumen ya ordenado por cubo,
+# interpolando entre las dos observaciones más próximas como hace pandas
+def calcular_cuantiles(cubos_resumen, cuentas, probabilidades):
+    acumuladas = np.cumsum(cuentas)
+    valores = valor_cubo(cubos_resumen)
+    rangos = np.asarray(probabilidades, dtype=float) * (acumuladas[-1] - 1)
+    inferior = valores[np.searchsorted(acumuladas, np.floor(rangos), side='right')]
+    superior = valores[np.searchsorted(acumuladas, np.ceil(rangos), side='right')]
+    return inferior + (rangos - np.floor(rangos)) * (superior - inferior)
+
+
+# Función para resumir la distribución de cada tipo de vivienda (cuartiles, bigotes, percentiles y total)
+def resumen_distribucion(tabla):
+    resumen = []
+    for tipo_vivienda, grupo in combinar_cuantiles(tabla, ['Tipo de vivienda']).groupby('Tipo de vivienda'):
+        cubos_tipo = grupo['Cubo'].to_numpy()
+        cuentas = grupo['Cuenta'].to_numpy()
+        q1, mediana, q3 = calcular_cuantiles(cubos_tipo, cuentas, [0.25, 0.5, 0.75])
+
+        # Bigotes como en un diagrama de caja: el valor más extremo a menos de 1,5 veces el rango intercuartílico
+        valores = valor_cubo(cubos_tipo)
+        rango = q3 - q1
+        dentro = valores[(valores >= q1 - 1.5 * rango) & (valores <= q3 + 1.5 * rango)]
+        fila = {
+            'Tipo de vivienda': tipo_vivienda,
+            'Observaciones': int(cuentas.sum()),
+            'q1': q1,
+            'mediana': mediana,
+            'q3': q3,
+            'minimo': dentro.min(),
+            'maximo': dentro.max(),
+        }
+        percentiles = calcular_cuantiles(cubos_tipo, cuentas, np.array(PERCENTILES) / 100)
+        fila.update({f'P{percentil}': valor for percentil, valor in zip(PERCENTILES, percentiles)})
+        resumen.append(fila)
+    return pd.DataFrame(resumen, columns=COLUMNAS_RESUMEN)
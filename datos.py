@@ -0,0 +1,106 @@
+import fcntl
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Archivos de datos de origen
+ARCHIVO_DATOS = 'datos_vivienda.csv'
+ARCHIVO_GEOJSON = 'georef-spain-municipio.geojson'
+
+# Archivo para almacenar el historial
+HISTORICAL_FILE = 'historico_busquedas.csv'
+
+# Bloqueo para que las sesiones concurrentes no mezclen sus escrituras en el historial
+bloqueo_historial = threading.Lock()
+
+
+# Función para bloquear el historial frente a los demás hilos y procesos (las réplicas de la aplicación y la
+# compactación) mientras se modifica
+@contextmanager
+def bloquear_historial(ruta=HISTORICAL_FILE):
+    with bloqueo_historial, open(f'{ruta}.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+# Columnas necesarias en el dataset principal
+required_columns = ['Ciudad', 'Año', 'Precio medio/m²', 'Valor medio de compra',
+                    'Variación anual (%)', 'Proyección 5 años (%)', 'Tipo de vivienda', 'Latitud', 'Longitud']
+
+
+# Tasa de interés y plazo para el cálculo de la hipoteca
+TASA_INTERES = 3.5  # Tasa de interés anual
+PLAZO_ANIOS = 30  # Plazo en años
+
+# Porcentaje de los ingresos dedicado a la hipoteca que separa cada nivel de viabilidad
+UMBRAL_VIABLE = 30
+UMBRAL_MODERADO = 50
+
+
+# Función para limpiar el dataset (se puede aplicar varias veces sin cambiar el resultado)
+def limpiar_datos(df):
+    df = df.copy()
+
+    # Limpiar los nombres de las columnas
+    df.columns = df.columns.str.strip()
+
+    # Convertir columnas numéricas relevantes (manejar errores y comas como separador decimal)
+    for columna in ['Precio medio/m²', 'Valor medio de compra', 'Variación anual (%)', 'Proyección 5 años (%)']:
+        if columna in df.columns:
+            df[columna] = pd.to_numeric(df[columna], errors='coerce')
+    for columna in ['Latitud', 'Longitud']:
+        if columna in df.columns:
+            df[columna] = df[columna].astype(str).str.replace(',', '.').astype(float)
+    return df
+
+
+# Función para obtener las columnas requeridas que faltan en el dataset
+def columnas_faltantes(df):
+    return [column for column in required_columns if column not in df.columns]
+
+
+# Función para calcular la hipoteca mensual (simplificada)
+def calcular_hipoteca(precio, tasa_interes, plazo_anos):
+    tasa_mensual = tasa_interes / 12 / 100
+    num_pagos = plazo_anos * 12
+    pago_mensual = precio * tasa_mensual / (1 - (1 + tasa_mensual) ** -num_pagos)
+    return pago_mensual
+
+
+# Función para determinar la viabilidad en base a los ingresos
+def determinar_viabilidad(hipoteca_mensual, ingresos):
+    porcentaje_ingresos = (hipoteca_mensual * 12) / ingresos * 100
+    if porcentaje_ingresos < UMBRAL_VIABLE:
+        return 1  # Verde: Viable
+    elif porcentaje_ingresos < UMBRAL_MODERADO:
+        return 2  # Amarillo: Moderadamente viable
+    else:
+        return 3  # Rojo: No viable
+
+
+# Función para determinar la viabilidad de muchas hipotecas a la vez (0 si no hay datos para calcularla)
+def codigos_viabilidad(hipotecas_mensuales, ingresos):
+    porcentaje_ingresos = (np.asarray(hipotecas_mensuales, dtype=float) * 12) / ingresos * 100
+    return np.select(
+        [porcentaje_ingresos < UMBRAL_VIABLE, porcentaje_ingresos < UMBRAL_MODERADO, porcentaje_ingresos >= UMBRAL_MODERADO],
+        [1, 2, 3],
+        default=0
+    )
+
+
+# Función para registrar una búsqueda añadiéndola al final del historial (sin reescribir el archivo completo)
+def registrar_busqueda(registro, ruta=HISTORICAL_FILE):
+    registro = dict(registro, Fecha=registro.get('Fecha', pd.Timestamp.now().isoformat(timespec='seconds')))
+    with bloquear_historial(ruta):
+        columnas = list(pd.read_csv(ruta, nrows=0).columns)
+        nuevas_columnas = [columna for columna in registro if columna not in columnas]
+        if nuevas_columnas:
+            # Historial creado con una versión anterior: se añaden las columnas nuevas una sola vez
+            historico = pd.read_csv(ruta)
+            columnas += nuevas_columnas
+            historico.reindex(columns=columnas).to_csv(ruta, index=False)
+        pd.DataFrame([registro]).reindex(columns=columnas).to_csv(ruta, mode='a', header=False, index=False)
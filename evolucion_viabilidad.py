@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from datos import PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca, codigos_viabilidad
+
+
+# Función para calcular en un solo paso la hipoteca mensual de cada tipo de vivienda, zona y año
+# (tipos x zonas x años) a partir del valor medio de compra de ese año
+def hipotecas_anuales(df):
+    tipos = sorted(df['Tipo de vivienda'].dropna().unique())
+    zonas = sorted(df['Ciudad'].dropna().unique())
+    anios = sorted(df['Año'].dropna().unique())
+    tabla = df.pivot_table(index=['Tipo de vivienda', 'Ciudad'], columns='Año', values='Valor medio de compra',
+                           aggfunc='mean')
+    tabla = tabla.reindex(index=pd.MultiIndex.from_product([tipos, zonas]), columns=anios)
+    valores = tabla.to_numpy(dtype=float).reshape(len(tipos), len(zonas), len(anios))
+    return {
+        'tipos': tipos,
+        'zonas': zonas,
+        'anios': [int(anio) for anio in anios],
+        'hipotecas': calcular_hipoteca(valores, TASA_INTERES, PLAZO_ANIOS),
+    }
+
+
+# Función para calcular la viabilidad de todas las zonas y años de un tipo de vivienda para unos ingresos:
+# devuelve los códigos de viabilidad y el porcentaje de los ingresos que supone la hipoteca (zonas x años)
+def viabilidad_anual(hipotecas, tipo_vivienda, ingresos):
+    if tipo_vivienda not in hipotecas['tipos']:
+        vacio = np.zeros((len(hipotecas['zonas']), len(hipotecas['anios'])))
+        return vacio.astype(int), vacio * np.nan
+    hipotecas_tipo = hipotecas['hipotecas'][hipotecas['tipos'].index(tipo_vivienda)]
+    return codigos_viabilidad(hipotecas_tipo, ingresos), hipotecas_tipo * 12 / ingresos * 100
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+from cuantiles import cuantiles_dataset, resumen_distribucion
+from graficos import figura_distribucion_precios, figura_tendencia_precios, formatear_numero
+from particiones import cargar_cuantiles_provincia, cargar_datos_provincia, cargar_indice, version_datos
+
+# Directorio de salida de los informes y archivo con las huellas de la última exportación
+DIRECTORIO_INFORMES = 'informes'
+ARCHIVO_MANIFIESTO = 'manifiesto.json'
+
+# Cambiar este valor obliga a regenerar todos los informes (por ejemplo, si cambia la plantilla)
+VERSION_INFORME = 2
+
+PLANTILLA_INFORME = """<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>{titulo}</title>
+<script src="plotly.min.js"></script>
+<style>
+    body {{ font-family: sans-serif; margin: 2em; color: #293241; }}
+    h1 {{ color: #EE6C4D; }}
+    .indicadores {{ display: flex; gap: 2em; margin-bottom: 1em; }}
+    .indicador {{ border: 1px solid #ccc; padding: 1em; flex: 1; }}
+    .indicador span {{ display: block; font-size: 1.5em; font-weight: bold; }}
+    .grafico {{ page-break-inside: avoid; break-inside: avoid; }}
+    @page {{ size: A4; margin: 1.5cm; }}
+    @media print {{ body {{ margin: 0; }} }}
+</style>
+</head>
+<body>
+<h1>{titulo}</h1>
+<p>Provincia de {provincia}</p>
+<div class="indicadores">
+    <div class="indicador">Precio medio/m²<span>{precio_m2} €/m²</span></div>
+    <div class="indicador">Valor medio de compra<span>{valor_compra} €</span></div>
+    <div class="indicador">Proyección 5 años<span>{proyeccion} %</span></div>
+</div>
+<div class="grafico">{grafico_tendencia}</div>
+<div class="grafico">{grafico_distribucion}</div>
+</body>
+</html>
+"""
+
+
+# Función para generar un nombre de archivo seguro a partir de un texto
+def normalizar_nombre(texto):
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', texto.lower()).strip('-')
+
+
+# Función para calcular la huella de los datos de entrada de un informe
+def huella_informe(tarea):
+    contenido = json.dumps({
+        'version': VERSION_INFORME,
+        'provincia': tarea['provincia'],
+        'indicadores': tarea['indicadores'],
+        'tendencia': tarea['tendencia'].to_dict('split'),
+        'distribucion': tarea['distribucion'],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+# Función para preparar las tareas de exportación a partir de los agregados compartidos de cada provincia
+def preparar_tareas(indice):
+    tareas = []
+    version = version_datos(indice)
+    for prov_code, provincia in indice['provincias'].items():
+        df = cargar_datos_provincia(prov_code, version)
+        if df.empty:
+            continue
+
+        # Agregados calculados una sola vez por provincia y compartidos por todos sus informes
+        indicadores = df.groupby(['Ciudad', 'Tipo de vivienda']).agg({
+            'Precio medio/m²': 'mean',
+            'Valor medio de compra': 'mean',
+            'Proyección 5 años (%)': 'mean',
+        })
+        tendencias = df.groupby(['Ciudad', 'Tipo de vivienda', 'Año']).agg({'Precio medio/m²': 'mean'}).reset_index()
+        cuantiles = cuantiles_dataset(df, cargar_cuantiles_provincia(prov_code, version))
+
+        # Filas de cada zona y tipo separadas en una sola pasada
+        tendencias_zonas = dict(iter(tendencias.groupby(['Ciudad', 'Tipo de vivienda'])))
+        cuantiles_zonas = dict(iter(cuantiles.groupby(['Ciudad', 'Tipo de vivienda'])))
+
+        for ciudad, tipo in indicadores.index:
+            distribucion = resumen_distribucion(cuantiles_zonas.get((ciudad, tipo), cuantiles.iloc[:0]))
+            tareas.append({
+                'archivo': f"{prov_code}_{normalizar_nombre(ciudad)}_{normalizar_nombre(tipo)}.html",
+                'provincia': provincia['nombre'],
+                'ciudad': ciudad,
+                'tipo': tipo,
+                'indicadores': indicadores.loc[(ciudad, tipo)].to_dict(),
+                'tendencia': tendencias_zonas[(ciudad, tipo)].drop(columns='Ciudad').reset_index(drop=True),
+                'distribucion': distribucion.to_dict('records'),
+            })
+    return tareas
+
+
+# Función para generar el informe HTML de una zona y tipo de vivienda (se ejecuta en un proceso del pool)
+def generar_informe(tarea, destino):
+    fig_line = figura_tendencia_precios(tarea['tendencia'], tarea['ciudad'])
+    fig_boxplot = figura_distribucion_precios(pd.DataFrame(tarea['distribucion']))
+
+    html = PLANTILLA_INFORME.format(
+        titulo=f"{tarea['ciudad']} - Vivienda {tarea['tipo'].lower()}",
+        provincia=tarea['provincia'],
+        precio_m2=formatear_numero(tarea['indicadores']['Precio medio/m²']),
+        valor_compra=formatear_numero(tarea['indicadores']['Valor medio de compra']),
+        proyeccion=formatear_numero(tarea['indicadores']['Proyección 5 años (%)']),
+        grafico_tendencia=fig_line.to_html(full_html=False, include_plotlyjs=False),
+        grafico_distribucion=fig_boxplot.to_html(full_html=False, include_plotlyjs=False),
+    )
+    with open(os.path.join(destino, tarea['archivo']), 'w', encoding='utf-8') as f:
+        f.write(html)
+    return tarea['archivo']
+
+
+# Función para exportar en paralelo los informes cuyos datos han cambiado desde la última exportación (o todos,
+# con forzar). El manifiesto guarda las huellas de los informes generados aunque alguno falle.
+def exportar_informes(destino=DIRECTORIO_INFORMES, procesos=None, forzar=False):
+    os.makedirs(destino, exist_ok=True)
+    ruta_manifiesto = os.path.join(destino, ARCHIVO_MANIFIESTO)
+    manifiesto = {}
+    if os.path.exists(ruta_manifiesto):
+        with open(ruta_manifiesto, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+
+    # Copia local de plotly.js para que los informes funcionen sin conexión
+    ruta_plotly = os.path.join(destino, 'plotly.min.js')
+    if not os.path.exists(ruta_plotly):
+        with open(ruta_plotly, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+
+    tareas = preparar_tareas(cargar_indice())
+    huellas = {tarea['archivo']: huella_informe(tarea) for tarea in tareas}
+    pendientes = [
+        tarea for tarea in tareas
+        if forzar
+        or manifiesto.get(tarea['archivo']) != huellas[tarea['archivo']]
+        or not os.path.exists(os.path.join(destino, tarea['archivo']))
+    ]
+
+    nuevo_manifiesto = {archivo: huella for archivo, huella in manifiesto.items() if archivo in huellas}
+    errores = {}
+    if pendientes:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = {pool.submit(generar_informe, tarea, destino): tarea['archivo'] for tarea in pendientes}
+            for futuro in as_completed(futuros):
+                archivo = futuros[futuro]
+                try:
+                    futuro.result()
+                except Exception as e:
+                    # El informe puede haber quedado a medio escribir: se regenerará en la próxima exportación
+                    errores[archivo] = e
+                    nuevo_manifiesto.pop(archivo, None)
+                else:
+                    nuevo_manifiesto[archivo] = huellas[archivo]
+
+    # Eliminar los informes de zonas que ya no existen en los datos
+    for archivo in set(manifiesto) - set(huellas):
+        ruta = os.path.join(destino, archivo)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    temporal = f'{ruta_manifiesto}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(nuevo_manifiesto, f, indent=2, sort_keys=True)
+    os.replace(temporal, ruta_manifiesto)
+
+    if errores:
+        archivo, error = next(iter(errores.items()))
+        raise RuntimeError(f"No se han podido generar {len(errores)} informes (primero: {archivo}: {error})") from error
+    return len(pendientes), len(tareas)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Exporta un informe HTML por zona y tipo de vivienda.")
+    parser.add_argument('--destino', default=DIRECTORIO_INFORMES, help="Directorio de salida de los informes")
+    parser.add_argument('--procesos', type=int, default=None, help="Número de procesos (por defecto, uno por núcleo)")
+    parser.add_argument('--forzar', action='store_true', help="Regenerar todos los informes aunque no hayan cambiado")
+    args = parser.parse_args()
+
+    generados, total = exportar_informes(args.destino, args.procesos, args.forzar)
+    print(f"Informes generados: {generados} de {total} ({total - generados} sin cambios)")
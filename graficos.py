@@ -0,0 +1,122 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Colores usados para los tipos de vivienda
+COLORES_TIPO_VIVIENDA = ["#3D5A80", "#EE6C4D"]
+
+
+# Función para formatear números con separadores personalizados
+def formatear_numero(numero):
+    return f"{numero:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# Función para calcular los indicadores clave de una zona
+def calcular_indicadores(zona_df):
+    return {
+        'Precio medio/m²': zona_df['Precio medio/m²'].mean(),
+        'Valor medio de compra': zona_df['Valor medio de compra'].mean(),
+        'Proyección 5 años (%)': zona_df['Proyección 5 años (%)'].mean(),
+    }
+
+
+# Función para calcular la evolución del precio por m² por año y tipo de vivienda
+def calcular_tendencia_precios(df):
+    return df.groupby(['Año', 'Tipo de vivienda']).agg({'Precio medio/m²': 'mean'}).reset_index()
+
+
+# Gráfico comparativo: evolución del precio por m² en todas las zonas
+def figura_comparativo(tendencia_todas_zonas):
+    fig_comparativo = px.line(
+        tendencia_todas_zonas,
+        x='Año',
+        y='Precio medio/m²',
+        color='Ciudad',
+        title="Evolución del precio por m² en todas las zonas",
+        labels={
+            "Precio medio/m²": "Precio medio (€/m²)",
+            "Año": "Año",
+            "Ciudad": "Zona"
+        },
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    fig_comparativo.update_traces(mode="lines+markers")
+    fig_comparativo.update_layout(
+        yaxis_tickformat=".2f",
+        yaxis_title="Precio medio (€/m²)",
+        xaxis_title="Año",
+        legend_title="Zonas"
+    )
+    return fig_comparativo
+
+
+# Gráfico de línea para la tendencia de precios de una zona
+def figura_tendencia_precios(tendencia_precios, zona):
+    fig_line = px.line(
+        tendencia_precios,
+        x='Año',
+        y='Precio medio/m²',
+        color='Tipo de vivienda',
+        title=f"Tendencia de precios en {zona} (2014-2024)",
+        markers=True,
+        color_discrete_sequence=COLORES_TIPO_VIVIENDA
+    )
+    fig_line.update_traces(mode="lines+markers")
+    return fig_line
+
+
+# Gráfico de caja (boxplot) para la distribución de precios por tipo de vivienda, dibujado a partir del
+# resumen de cuantiles de cada tipo (ver cuantiles.resumen_distribucion) en lugar de las filas originales
+def figura_distribucion_precios(resumen):
+    fig_boxplot = go.Figure()
+    for (_, fila), color in zip(resumen.iterrows(), COLORES_TIPO_VIVIENDA * len(resumen)):
+        fig_boxplot.add_trace(go.Box(
+            name=fila['Tipo de vivienda'],
+            x=[fila['Tipo de vivienda']],
+            q1=[fila['q1']],
+            median=[fila['mediana']],
+            q3=[fila['q3']],
+            lowerfence=[fila['minimo']],
+            upperfence=[fila['maximo']],
+            marker_color=color
+        ))
+    fig_boxplot.update_layout(
+        title="Distribución de precios por tipo de vivienda",
+        showlegend=False,
+        yaxis_tickformat=".2f",
+        yaxis_title="Precio medio (€/m²)",
+        xaxis_title=""
+    )
+    return fig_boxplot
+
+
+# Mapa de calor con la viabilidad de compra de cada zona en cada año
+def figura_evolucion_viabilidad(zonas, anios, codigos, porcentajes, colores, textos):
+    # Escala de colores discreta: cada código ocupa un cuarto de la escala (con zmin=-0.5 y zmax=3.5)
+    escala = []
+    for codigo in range(4):
+        escala += [[codigo / 4, colores[codigo]], [(codigo + 1) / 4, colores[codigo]]]
+    texto = np.vectorize(textos.get)(codigos)
+
+    fig_evolucion = go.Figure(go.Heatmap(
+        z=codigos,
+        x=anios,
+        y=zonas,
+        customdata=np.dstack([texto, np.char.mod('%.1f', porcentajes)]),
+        hovertemplate="%{y} (%{x})<br>%{customdata[0]}<br>Hipoteca: %{customdata[1]} % de los ingresos<extra></extra>",
+        colorscale=escala,
+        zmin=-0.5,
+        zmax=3.5,
+        showscale=False,
+        xgap=1,
+        ygap=1
+    ))
+    fig_evolucion.update_layout(
+        title="Viabilidad de compra por año",
+        xaxis_title="Año",
+        yaxis_title="",
+        xaxis=dict(dtick=1),
+        yaxis=dict(autorange='reversed'),
+        height=max(300, 22 * len(zonas) + 120)
+    )
+    return fig_evolucion
@@ -1,46 +1,65 @@
 import streamlit as st
 import pandas as pd
-import geopandas as gpd
-import folium
-from streamlit_folium import folium_static
-import plotly.express as px
 import os
 
-# Cargar el dataset principal
-df = pd.read_csv('datos_vivienda.csv', sep=';')
+from cache_compartida import cache_resultados
+from compactar_historial import tendencia_busquedas
+from cuantiles import PERCENTILES
+from componente_mapa import mapa_zonas
+from datos import (HISTORICAL_FILE, PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca, columnas_faltantes, determinar_viabilidad,
+                   registrar_busqueda)
+from graficos import calcular_indicadores, formatear_numero
+from mapa import ALTO_MAPA, capa_viabilidad
+from particiones import PROVINCIA_POR_DEFECTO
+from perfiles import estado_perfil
+from recomendaciones import PESOS_RECOMENDACION
+from recursos import (almacen_perfiles, indice_ingresos, obtener_capa_segmentos, obtener_estado_zonas,
+                      obtener_figura_comparativo, obtener_figura_distribucion, obtener_figura_evolucion_viabilidad,
+                      obtener_figura_tendencia, obtener_geometrias_mapa, obtener_indice, obtener_puntos_zonas,
+                      obtener_recomendaciones, obtener_resumen_distribucion, obtener_riesgo_tipos,
+                      obtener_segmentos_provincia, obtener_version, obtener_viabilidad_mapa, obtener_viabilidad_puntos,
+                      obtener_zonas_similares, precargar_provincia)
+from simulacion_tipos import TASA_LARGO_PLAZO, VOLATILIDAD
 
-# Limpiar los nombres de las columnas
-df.columns = df.columns.str.strip()
+try:
+    indice = obtener_indice()
+except (OSError, ValueError) as e:
+    st.error(f"Error al preparar los datos por provincia: {e}")
+    st.stop()
+
+st.sidebar.header("Introduce tus datos")
+provincias = indice['provincias']
+codigos_provincia = sorted(provincias, key=lambda codigo: provincias[codigo]['nombre'])
+provincia = st.sidebar.selectbox(
+    "Selecciona la provincia:",
+    codigos_provincia,
+    index=codigos_provincia.index(PROVINCIA_POR_DEFECTO) if PROVINCIA_POR_DEFECTO in codigos_provincia else 0,
+    format_func=lambda codigo: provincias[codigo]['nombre']
+)
 
-# Convertir columnas numéricas relevantes (manejar errores y comas como separador decimal)
-df['Precio medio/m²'] = pd.to_numeric(df['Precio medio/m²'], errors='coerce')
-df['Valor medio de compra'] = pd.to_numeric(df['Valor medio de compra'], errors='coerce')
-df['Variación anual (%)'] = pd.to_numeric(df['Variación anual (%)'], errors='coerce')
-df['Proyección 5 años (%)'] = pd.to_numeric(df['Proyección 5 años (%)'], errors='coerce')
-df['Latitud'] = df['Latitud'].astype(str).str.replace(',', '.').astype(float)
-df['Longitud'] = df['Longitud'].astype(str).str.replace(',', '.').astype(float)
+# Cargar en paralelo el dataset, las geometrías y el historial de la provincia seleccionada.
+# Solo se espera al dataset; las geometrías siguen cargándose mientras se muestran los indicadores.
+cargas = precargar_provincia(provincia)
+df = cargas['datos'].result()
 
 # Verificar columnas necesarias
-required_columns = ['Ciudad', 'Año', 'Precio medio/m²', 'Valor medio de compra', 
-                    'Variación anual (%)', 'Proyección 5 años (%)', 'Tipo de vivienda', 'Latitud', 'Longitud']
-for column in required_columns:
-    if column not in df.columns:
-        st.error(f"El dataset no contiene la columna requerida: {column}. Por favor, verifica el archivo.")
-        st.stop()
+for column in columnas_faltantes(df):
+    st.error(f"El dataset no contiene la columna requerida: {column}. Por favor, verifica el archivo.")
+    st.stop()
 
-# Archivo para almacenar el historial
-HISTORICAL_FILE = 'historico_busquedas.csv'
+if df.empty:
+    st.info(f"No hay datos de vivienda disponibles para la provincia de {provincias[provincia]['nombre']}.")
+    st.stop()
 
 # Crear el archivo si no existe
 if not os.path.exists(HISTORICAL_FILE):
-    pd.DataFrame(columns=['Edad', 'Ingresos', 'Zona', 'Precio medio/m²', 'Valor medio de compra', 
-                          'Proyección 5 años (%)']).to_csv(HISTORICAL_FILE, index=False)
+    pd.DataFrame(columns=['Edad', 'Ingresos', 'Zona', 'Precio medio/m²', 'Valor medio de compra',
+                          'Proyección 5 años (%)', 'Fecha']).to_csv(HISTORICAL_FILE, index=False)
 
 # Título principal
 st.markdown("<h1 style='text-align: center; color: #EE6C4D;'>Herramienta de Análisis de Vivienda</h1>", unsafe_allow_html=True)
 
 # Solicitar datos del usuario
-st.sidebar.header("Introduce tus datos")
 edad = st.sidebar.number_input("¿Cuál es tu edad?", min_value=18, max_value=100, step=1)
 ingresos = st.sidebar.number_input("¿Cuáles son tus ingresos anuales (en euros)?", min_value=1000, step=100)
 zona_preferencia = st.sidebar.selectbox("Selecciona tu zona o localidad preferida:", df['Ciudad'].unique())
@@ -52,51 +71,10 @@ tipo_vivienda_preferencia = st.sidebar.selectbox(
 # Filtrar los datos según la zona seleccionada
 zona_df = df[df['Ciudad'] == zona_preferencia]
 
-# Cargar datos geoespaciales
-try:
-    gdf = gpd.read_file("georef-spain-municipio.geojson")
-except:
-    st.error("Error al cargar el archivo GeoJSON. Asegúrate de que el archivo 'georef-spain-municipio.geojson' esté disponible.")
-    st.stop()
-
-# Función para asignar colores según los criterios de viabilidad
-def asignar_color(criterio):
-    if criterio == 1:
-        return 'green'
-    elif criterio == 2:
-        return 'orange'
-    elif criterio == 3:
-        return 'red'
-    return 'gray'
-
-# Función para calcular la hipoteca mensual (simplificada)
-def calcular_hipoteca(precio, tasa_interes, plazo_anos):
-    tasa_mensual = tasa_interes / 12 / 100
-    num_pagos = plazo_anos * 12
-    pago_mensual = precio * tasa_mensual / (1 - (1 + tasa_mensual) ** -num_pagos)
-    return pago_mensual
-
-# Función para determinar la viabilidad en base a los ingresos
-def determinar_viabilidad(hipoteca_mensual, ingresos):
-    porcentaje_ingresos = (hipoteca_mensual * 12) / ingresos * 100
-    if porcentaje_ingresos < 30:
-        return 1  # Verde: Viable
-    elif porcentaje_ingresos < 50:
-        return 2  # Amarillo: Moderadamente viable
-    else:
-        return 3  # Rojo: No viable
-
-# Tasa de interés y plazo para el cálculo de la hipoteca
-TASA_INTERES = 3.5  # Tasa de interés anual
-PLAZO_ANIOS = 30  # Plazo en años
-
 if not zona_df.empty:
     # Pestañas para estructurar la visualización
-    tab1, tab2, tab3, tab4 = st.tabs(["Indicadores", "Gráficos", "Mapa de Zonas", "Historial de búsquedas"])
-
-# Función para formatear números con separadores personalizados
-def formatear_numero(numero):
-    return f"{numero:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Indicadores", "Gráficos", "Mapa de Zonas", "Historial de búsquedas",
+                                                  "Riesgo de tipos", "Viabilidad por año"])
 
 # Tab 1: Indicadores
 with tab1:
@@ -104,58 +82,73 @@ with tab1:
 
     # Usar columnas para organizar indicadores
     col1, col2, col3 = st.columns(3)
+    indicadores = calcular_indicadores(zona_df)
+    precio_m2 = indicadores['Precio medio/m²']
+    valor_compra = indicadores['Valor medio de compra']
+    proyeccion = indicadores['Proyección 5 años (%)']
 
     with col1:
-        precio_m2 = zona_df['Precio medio/m²'].mean()
-        st.metric(label="Precio medio/m²", value=f"{precio_m2:,.2f} €/m²".replace(",", "X").replace(".", ",").replace("X", "."))
+        st.metric(label="Precio medio/m²", value=f"{formatear_numero(precio_m2)} €/m²")
 
     with col2:
-        valor_compra = zona_df['Valor medio de compra'].mean()
-        st.metric(label="Valor medio de compra", value=f"{valor_compra:,.2f} €".replace(",", "X").replace(".", ",").replace("X", "."))
+        st.metric(label="Valor medio de compra", value=f"{formatear_numero(valor_compra)} €")
 
     with col3:
-        proyeccion = zona_df['Proyección 5 años (%)'].mean()
-        st.metric(label="Proyección 5 años", value=f"{proyeccion:,.2f} %".replace(",", "X").replace(".", ",").replace("X", "."))
+        st.metric(label="Proyección 5 años", value=f"{formatear_numero(proyeccion)} %")
 
     # Registrar la búsqueda en el historial
-    nuevo_registro = pd.DataFrame([{
+    registrar_busqueda({
         'Edad': edad,
         'Ingresos': ingresos,
         'Zona': zona_preferencia,
         'Precio medio/m²': precio_m2,
         'Valor medio de compra': valor_compra,
         'Proyección 5 años (%)': proyeccion
-    }])
-    historico = pd.read_csv(HISTORICAL_FILE)
-    historico = pd.concat([historico, nuevo_registro], ignore_index=True)
-    historico.to_csv(HISTORICAL_FILE, index=False)
+    })
+
+    # Porcentaje de usuarios que podrían permitirse la zona (hipoteca por debajo del 30% de sus ingresos)
+    indice_ingresos.actualizar()
+    asequible_global = indice_ingresos.porcentaje_asequible(valor_compra)
+    asequible_zona = indice_ingresos.porcentaje_asequible(valor_compra, zona=zona_preferencia)
+
+    col4, col5 = st.columns(2)
+    with col4:
+        if asequible_global is not None:
+            st.metric(label="Usuarios que podrían permitírsela",
+                      value=f"{formatear_numero(asequible_global)} %")
+    with col5:
+        if asequible_zona is not None:
+            st.metric(label=f"Usuarios interesados en {zona_preferencia} que podrían permitírsela",
+                      value=f"{formatear_numero(asequible_zona)} %")
+    st.caption("Porcentaje de búsquedas registradas cuyos ingresos permiten una hipoteca inferior al 30% de los ingresos.")
+
+    # Alternativas similares si la zona preferida no es viable para el tipo de vivienda elegido
+    valor_compra_tipo = zona_df[zona_df['Tipo de vivienda'] == tipo_vivienda_preferencia]['Valor medio de compra'].mean()
+    if pd.notna(valor_compra_tipo) and determinar_viabilidad(
+            calcular_hipoteca(valor_compra_tipo, TASA_INTERES, PLAZO_ANIOS), ingresos) != 1:
+        st.subheader("Alternativas similares")
+        alternativas_df = obtener_zonas_similares(provincia, zona_preferencia, tipo_vivienda_preferencia, ingresos)
+        if alternativas_df.empty:
+            st.info(f"No hay zonas parecidas a {zona_preferencia} con una hipoteca inferior al 30% de tus ingresos.")
+        else:
+            st.write(f"{zona_preferencia} supera el 30% de tus ingresos para vivienda '{tipo_vivienda_preferencia}'. "
+                     f"Estas zonas tienen precios, evolución y ubicación parecidos y sí entran en tu presupuesto:")
+            st.dataframe(
+                alternativas_df.style.format({
+                    'Precio medio/m²': lambda valor: f"{formatear_numero(valor)} €/m²",
+                    'Valor medio de compra': lambda valor: f"{formatear_numero(valor)} €",
+                    'Variación anual (%)': lambda valor: f"{formatear_numero(valor)} %",
+                    'Proyección 5 años (%)': lambda valor: f"{formatear_numero(valor)} %",
+                    'Hipoteca mensual': lambda valor: f"{formatear_numero(valor)} €",
+                    'Porcentaje de ingresos': lambda valor: f"{formatear_numero(valor)} %",
+                    'Similitud': lambda valor: formatear_numero(valor),
+                }),
+                hide_index=True
+            )
 
     # Nuevo gráfico comparativo: Evolución del precio por m²
     st.subheader(f"Evolución del precio para viviendas '{tipo_vivienda_preferencia}' en todas las zonas")
-    filtro_tipo_vivienda = df[df['Tipo de vivienda'] == tipo_vivienda_preferencia]
-    tendencia_todas_zonas = filtro_tipo_vivienda.groupby(['Año', 'Ciudad']).agg({'Precio medio/m²': 'mean'}).reset_index()
-
-    fig_comparativo = px.line(
-        tendencia_todas_zonas,
-        x='Año',
-        y='Precio medio/m²',
-        color='Ciudad',
-        title="Evolución del precio por m² en todas las zonas",
-        labels={
-            "Precio medio/m²": "Precio medio (€/m²)",
-            "Año": "Año",
-            "Ciudad": "Zona"
-        },
-        color_discrete_sequence=px.colors.qualitative.Set3
-    )
-    fig_comparativo.update_traces(mode="lines+markers")
-    fig_comparativo.update_layout(
-        yaxis_tickformat=".2f",
-        yaxis_title="Precio medio (€/m²)",
-        xaxis_title="Año",
-        legend_title="Zonas"
-    )
-
+    fig_comparativo = obtener_figura_comparativo(provincia, tipo_vivienda_preferencia)
     st.plotly_chart(fig_comparativo, use_container_width=True)
 
 
@@ -164,113 +157,24 @@ with tab2:
     st.subheader("Tendencias de precios")
 
     # Gráfico de línea para la tendencia de precios
-    tendencia_precios = zona_df.groupby(['Año', 'Tipo de vivienda']).agg({'Precio medio/m²': 'mean'}).reset_index()
-    fig_line = px.line(
-        tendencia_precios,
-        x='Año',
-        y='Precio medio/m²',
-        color='Tipo de vivienda',
-        title=f"Tendencia de precios en {zona_preferencia} (2014-2024)",
-        markers=True,
-        color_discrete_sequence=["#3D5A80", "#EE6C4D"]
-    )
-    fig_line.update_traces(mode="lines+markers")
+    fig_line = obtener_figura_tendencia(provincia, zona_preferencia)
     st.plotly_chart(fig_line, use_container_width=True)
 
     st.subheader("Distribución de precios por tipo de vivienda")
 
     # Gráfico de caja (boxplot) para la distribución de precios por tipo de vivienda
-    fig_boxplot = px.box(
-        zona_df,
-        x='Tipo de vivienda',
-        y='Precio medio/m²',
-        color='Tipo de vivienda',
-        title="Distribución de precios por tipo de vivienda",
-        labels={
-            "Precio medio/m²": "Precio medio (€/m²)",
-            "Tipo de vivienda": "Tipo de vivienda"
-        },
-        color_discrete_sequence=["#3D5A80", "#EE6C4D"]
-    )
-    fig_boxplot.update_layout(
-        showlegend=False,
-        yaxis_tickformat=".2f",
-        yaxis_title="Precio medio (€/m²)",
-        xaxis_title=""
-    )
-
+    fig_boxplot = obtener_figura_distribucion(provincia, zona_preferencia)
     st.plotly_chart(fig_boxplot, use_container_width=True)
 
-
-# Tab 3: Mapa de Zonas
-with tab3:
-    st.subheader("Mapa de Viabilidad de Compra")
-
-    # Crear el mapa
-    mapa_sevilla = folium.Map(location=[37.3886, -5.9823], zoom_start=10)
-
-    # Añadir zonas con colores según viabilidad
-    for _, row in gdf.iterrows():
-        try:
-            zona_nombre = row['mun_name']
-            geometry = row['geometry']
-
-            if geometry.is_valid:
-                zona_precio = df[df['Ciudad'] == zona_nombre]['Valor medio de compra'].mean()
-                hipoteca_mensual = calcular_hipoteca(zona_precio, TASA_INTERES, PLAZO_ANIOS)
-                criterio_viabilidad = determinar_viabilidad(hipoteca_mensual, ingresos)
-
-                folium.GeoJson(
-                    geometry,
-                    style_function=lambda x, criterio=criterio_viabilidad: {
-                        'fillColor': asignar_color(criterio),
-                        'color': 'black',
-                        'weight': 1,
-                        'fillOpacity': 0.6,
-                    },
-                    tooltip=f"{zona_nombre} - Viabilidad: {criterio_viabilidad}"
-                ).add_to(mapa_sevilla)
-        except KeyError:
-            st.warning(f"No se pudo procesar la zona: {zona_nombre}")
-
-    # Añadir leyenda personalizada
-    legend_html = """
-    <div style="
-        position: fixed;
-        bottom: 50px;
-        left: 50px;
-        width: 250px;
-        height: 140px;
-        background-color: white;
-        border: 2px solid black;
-        z-index: 1000;
-        padding: 10px;
-        font-size: 14px;
-    ">
-        <b>Viabilidad de compra:</b><br>
-        <i style="background: green; width: 15px; height: 15px; display: inline-block; margin-right: 5px;"></i>
-        Viable (&lt; 30% de ingresos)<br>
-        <i style="background: orange; width: 15px; height: 15px; display: inline-block; margin-right: 5px;"></i>
-        Moderadamente viable (30%-50% de ingresos)<br>
-        <i style="background: red; width: 15px; height: 15px; display: inline-block; margin-right: 5px;"></i>
-        No viable (&gt; 50% de ingresos)<br>
-        <i style="background: gray; width: 15px; height: 15px; display: inline-block; margin-right: 5px;"></i>
-        Sin datos disponibles<br>
-    </div>
-    """
-    mapa_sevilla.get_root().html.add_child(folium.Element(legend_html))
-
-    # Mostrar el mapa en Streamlit
-    folium_static(mapa_sevilla)
-
-    # Añadir descripción de los criterios
-    st.markdown("""
-        **Criterios de viabilidad:**  
-        - 🟢 **Viable:** El coste de la hipoteca mensual representa menos del 30% de los ingresos anuales.  
-        - 🟠 **Moderadamente viable:** El coste de la hipoteca mensual está entre el 30% y el 50% de los ingresos anuales.  
-        - 🔴 **No viable:** El coste de la hipoteca mensual supera el 50% de los ingresos anuales.  
-        - ⚪ **Sin datos:** No se dispone de información suficiente para calcular la viabilidad.
-    """)
+    # Percentiles del precio por m² calculados a partir de los mismos resúmenes de cuantiles
+    resumen_df = obtener_resumen_distribucion(provincia, zona_preferencia)
+    columnas_percentiles = [f'P{percentil}' for percentil in PERCENTILES]
+    st.dataframe(
+        resumen_df[['Tipo de vivienda', 'Observaciones'] + columnas_percentiles].style.format(
+            {columna: lambda valor: f"{formatear_numero(valor)} €/m²" for columna in columnas_percentiles}
+        ),
+        hide_index=True
+    )
 
 
 # Tab 4: Historial de búsquedas con recomendaciones mejoradas
@@ -286,55 +190,50 @@ with tab4:
         st.markdown("### Historial de búsquedas")
         st.dataframe(historico)
 
+        # Evolución semanal de las búsquedas de la zona (a partir de los agregados del historial compactado)
+        tendencia = tendencia_busquedas(zona=zona_preferencia)
+        if not tendencia.empty:
+            st.markdown(f"### Búsquedas semanales de {zona_preferencia}")
+            st.line_chart(tendencia.set_index('Periodo')['Busquedas'])
+
         # Generar recomendaciones personalizadas con puntuación compuesta
         st.markdown("### Recomendaciones personalizadas basadas en múltiples factores")
 
-        # Filtrar el dataset según el tipo de vivienda seleccionado
-        df_filtrado = df[df['Tipo de vivienda'] == tipo_vivienda_preferencia]
-
-        # Calcular el promedio de precio medio/m² para usar como referencia
-        promedio_precio_m2 = df['Precio medio/m²'].mean()
-
-        # Crear un nuevo DataFrame para las recomendaciones
-        recomendaciones = []
-        for _, row in df_filtrado.iterrows():
-            precio = row['Valor medio de compra']
-            proyeccion = row['Proyección 5 años (%)']
-            precio_m2 = row['Precio medio/m²']
-
-            if pd.isna(precio) or precio <= 0 or pd.isna(proyeccion) or pd.isna(precio_m2):
-                continue  # Ignorar registros con valores faltantes o inválidos
-
-            # Calcular viabilidad financiera
-            hipoteca_mensual = calcular_hipoteca(precio, TASA_INTERES, PLAZO_ANIOS)
-            porcentaje_ingresos = (hipoteca_mensual * 12) / ingresos * 100
-
-            # Calcular puntuaciones individuales
-            puntuacion_viabilidad = max(0, 100 - porcentaje_ingresos)  # Menor porcentaje es mejor
-            puntuacion_proyeccion = max(0, proyeccion)  # Mayor proyección es mejor
-            puntuacion_accesibilidad = max(0, 100 - abs(precio_m2 - promedio_precio_m2))  # Más cerca del promedio es mejor
-
-            # Ponderar las puntuaciones
-            puntuacion_total = (
-                0.4 * puntuacion_viabilidad +
-                0.3 * puntuacion_proyeccion +
-                0.3 * puntuacion_accesibilidad
-            )
-
-            recomendaciones.append({
-                'Ciudad': row['Ciudad'],
-                'Tipo de vivienda': row['Tipo de vivienda'],
-                'Precio medio/m²': precio_m2,
-                'Valor medio de compra': precio,
-                'Proyección 5 años (%)': proyeccion,
-                'Hipoteca mensual': hipoteca_mensual,
-                'Porcentaje de ingresos': porcentaje_ingresos,
-                'Puntuación total': puntuacion_total
-            })
-
-        # Convertir las recomendaciones en un DataFrame y ordenarlas por puntuación total
-        recomendaciones_df = pd.DataFrame(recomendaciones)
-        recomendaciones_df = recomendaciones_df.sort_values(by='Puntuación total', ascending=False)
+        # Modo de recomendación y peso de cada criterio (las puntuaciones ya están normalizadas entre 0 y 1)
+        modo_recomendacion = st.radio(
+            "Modo de recomendación:",
+            ["Puntuación ponderada", "Frente de Pareto"],
+            horizontal=True,
+            help="El frente de Pareto muestra solo las zonas que ninguna otra supera a la vez en viabilidad, "
+                 "proyección a 5 años y cercanía al precio medio/m²."
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            peso_viabilidad = st.slider("Peso de la viabilidad", 0.0, 1.0, PESOS_RECOMENDACION['viabilidad'], 0.05)
+        with col2:
+            peso_proyeccion = st.slider("Peso de la proyección", 0.0, 1.0, PESOS_RECOMENDACION['proyeccion'], 0.05)
+        with col3:
+            peso_accesibilidad = st.slider("Peso del precio/m²", 0.0, 1.0, PESOS_RECOMENDACION['accesibilidad'], 0.05)
+
+        # Calcular las recomendaciones (o reutilizarlas si otra sesión ya las ha calculado)
+        recomendaciones_df = obtener_recomendaciones(
+            provincia, tipo_vivienda_preferencia, ingresos,
+            pesos={'viabilidad': peso_viabilidad, 'proyeccion': peso_proyeccion, 'accesibilidad': peso_accesibilidad},
+            solo_pareto=modo_recomendacion == "Frente de Pareto"
+        )
+
+        # Filtrar las recomendaciones por segmento de mercado
+        segmentos_df = obtener_segmentos_provincia(provincia)
+        segmentos_seleccionados = st.multiselect(
+            "Segmentos de mercado:",
+            sorted(segmentos_df['Nombre segmento'].unique()),
+            placeholder="Todos los segmentos"
+        )
+        recomendaciones_df = recomendaciones_df.merge(
+            segmentos_df[['Ciudad', 'Nombre segmento']], on='Ciudad', how='left'
+        ) if not recomendaciones_df.empty else recomendaciones_df
+        if segmentos_seleccionados and not recomendaciones_df.empty:
+            recomendaciones_df = recomendaciones_df[recomendaciones_df['Nombre segmento'].isin(segmentos_seleccionados)]
 
         if recomendaciones_df.empty:
             st.info("No se encontraron recomendaciones viables basadas en tus ingresos y preferencia de vivienda.")
@@ -342,6 +241,8 @@ with tab4:
             # Mostrar las 5 mejores recomendaciones
             for _, row in recomendaciones_df.head(5).iterrows():
                 st.markdown(f"**{row['Ciudad']}** ({row['Tipo de vivienda']})")
+                if pd.notna(row['Nombre segmento']):
+                    st.write(f"- Segmento de mercado: {row['Nombre segmento']}")
                 st.write(f"- Precio medio/m²: {row['Precio medio/m²']:.2f} €/m²")
                 st.write(f"- Valor medio de compra: {row['Valor medio de compra']:.2f} €")
                 st.write(f"- Proyección a 5 años: {row['Proyección 5 años (%)']:.2f} %")
@@ -349,3 +250,115 @@ with tab4:
                 st.write(f"- Porcentaje de ingresos: {row['Porcentaje de ingresos']:.2f} %")
                 st.write(f"- **Puntuación total:** {row['Puntuación total']:.2f}")
                 st.write("---")
+
+
+# Tab 5: Riesgo de tipos de interés variables
+with tab5:
+    st.subheader("Riesgo de la hipoteca con tipos de interés variables")
+    st.write(
+        f"Probabilidad de que, en algún momento de los {PLAZO_ANIOS} años de la hipoteca, la cuota supere el 30% o el 50% "
+        f"de tus ingresos si el tipo de interés (actualmente {formatear_numero(TASA_INTERES)} %) se revisa cada año."
+    )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        tasa_largo_plazo = st.slider("Tipo de interés medio a largo plazo (%)", 0.0, 8.0, TASA_LARGO_PLAZO, 0.25)
+    with col2:
+        volatilidad = st.slider("Volatilidad anual del tipo (puntos porcentuales)", 0.0, 3.0, VOLATILIDAD, 0.1)
+
+    riesgo_df = obtener_riesgo_tipos(provincia, ingresos, tasa_largo_plazo, volatilidad)
+    st.dataframe(
+        riesgo_df.style.format({
+            columna: (lambda valor: f"{formatear_numero(valor)} %") if columna.startswith('Prob.')
+            else (lambda valor: f"{formatear_numero(valor)} €")
+            for columna in riesgo_df.columns if columna != 'Ciudad'
+        }),
+        hide_index=True
+    )
+
+
+# Tab 6: Evolución de la viabilidad de todas las zonas con el precio de cada año
+with tab6:
+    st.subheader(f"Viabilidad de compra por año para vivienda '{tipo_vivienda_preferencia}'")
+    st.write("Viabilidad que habría tenido cada zona en cada año con tus ingresos actuales y el valor medio de "
+             "compra de ese año.")
+    fig_evolucion = obtener_figura_evolucion_viabilidad(provincia, tipo_vivienda_preferencia, ingresos)
+    st.plotly_chart(fig_evolucion, use_container_width=True)
+
+
+# Tab 3: Mapa de Zonas (se rellena al final para no retrasar el resto de pestañas mientras cargan las geometrías)
+with tab3:
+    st.subheader("Mapa de Viabilidad de Compra")
+
+    try:
+        with st.spinner("Cargando el mapa de la provincia..."):
+            cargas['geometrias'].result()
+    except Exception:
+        st.error("Error al cargar las geometrías de la provincia. Asegúrate de que el archivo 'georef-spain-municipio.geojson' esté disponible.")
+        st.stop()
+
+    # Capa alternativa con los segmentos de mercado precalculados
+    capa_mapa = st.radio("Capa del mapa:", ["Viabilidad de compra", "Segmentos de mercado"], horizontal=True)
+    if capa_mapa == "Segmentos de mercado":
+        capa = obtener_capa_segmentos(provincia)
+    else:
+        capa = capa_viabilidad(obtener_viabilidad_mapa(provincia, ingresos))
+
+    # Marcadores con el centro de las zonas de todas las provincias, agrupados al alejar el mapa
+    mostrar_puntos = st.checkbox("Mostrar los centros de las zonas de todas las provincias")
+
+    # Mostrar el mapa: las geometrías se envían al navegador una sola vez por sesión y provincia,
+    # y en cada cambio de ingresos o de capa solo se envía el código de cada zona
+    mapa_zonas(
+        id_geometrias=f"{obtener_version()}-{provincia}",
+        obtener_geometrias=lambda: obtener_geometrias_mapa(provincia),
+        capa=capa,
+        centro=provincias[provincia]['centro'],
+        limites=provincias[provincia]['limites'],
+        alto=ALTO_MAPA,
+        id_puntos=obtener_version(),
+        obtener_puntos=obtener_puntos_zonas,
+        capa_puntos=capa_viabilidad(obtener_viabilidad_puntos(ingresos)) if mostrar_puntos else None
+    )
+
+    # Añadir descripción de los criterios
+    if capa_mapa == "Segmentos de mercado":
+        st.caption("Segmentos de mercado obtenidos agrupando todas las zonas según la evolución anual de su precio "
+                   "por m², su variación anual y su proyección a 5 años.")
+    else:
+        st.markdown("""
+            **Criterios de viabilidad:**  
+            - 🟢 **Viable:** El coste de la hipoteca mensual representa menos del 30% de los ingresos anuales.  
+            - 🟠 **Moderadamente viable:** El coste de la hipoteca mensual está entre el 30% y el 50% de los ingresos anuales.  
+            - 🔴 **No viable:** El coste de la hipoteca mensual supera el 50% de los ingresos anuales.  
+            - ⚪ **Sin datos:** No se dispone de información suficiente para calcular la viabilidad.
+        """)
+
+
+# Perfil guardado: se revisa tras cada actualización de los datos y se avisa si cambia la viabilidad de la zona
+# o su posición entre las más asequibles de la provincia
+with st.sidebar.expander("Avisos de tu perfil"):
+    if st.button("Guardar perfil y recibir avisos"):
+        viabilidad_perfil, posicion_perfil = estado_perfil(
+            obtener_estado_zonas(provincia), provincia, zona_preferencia, tipo_vivienda_preferencia, ingresos
+        )
+        st.session_state['perfil_id'] = almacen_perfiles.guardar_perfil(
+            edad, ingresos, provincia, zona_preferencia, tipo_vivienda_preferencia, viabilidad_perfil, posicion_perfil
+        )
+    perfil_id = st.text_input("Identificador de perfil:", value=st.session_state.get('perfil_id', ''))
+    if perfil_id:
+        avisos_df = almacen_perfiles.notificaciones(perfil_id.strip())
+        if avisos_df.empty:
+            st.write("No hay avisos para este perfil.")
+        for _, aviso in avisos_df.iterrows():
+            st.write(f"- {aviso['Fecha']}: {aviso['Mensaje']}")
+
+
+# Métricas de la caché compartida entre sesiones
+with st.sidebar.expander("Estadísticas de la caché"):
+    metricas_cache = cache_resultados.metricas()
+    st.write(f"- Entradas: {metricas_cache['entradas']} de {metricas_cache['capacidad']}")
+    st.write(f"- Aciertos: {metricas_cache['aciertos']}")
+    st.write(f"- Fallos: {metricas_cache['fallos']}")
+    st.write(f"- Esperas a otra sesión: {metricas_cache['esperas']}")
+    st.write(f"- Tasa de aciertos: {formatear_numero(metricas_cache['tasa_aciertos'] * 100)} %")
@@ -0,0 +1,107 @@
+import io
+import os
+import threading
+from bisect import bisect_right, insort
+
+import pandas as pd
+
+from compactar_historial import DIRECTORIO_HISTORIAL, leer_archivo
+from datos import HISTORICAL_FILE, PLAZO_ANIOS, TASA_INTERES, UMBRAL_VIABLE, calcular_hipoteca
+
+# A partir de este número de filas nuevas se fusionan en bloque en lugar de insertarlas una a una
+TAMANO_FUSION = 64
+
+
+# Índice ordenado de los ingresos registrados en el historial de búsquedas (activo y compactado), global y
+# por zona. Se actualiza leyendo solo las filas añadidas al historial activo desde la última lectura.
+class IndiceIngresos:
+    def __init__(self, ruta=HISTORICAL_FILE, directorio_archivo=DIRECTORIO_HISTORIAL):
+        self.ruta = ruta
+        self.directorio_archivo = directorio_archivo
+        self.ingresos = []
+        self.ingresos_por_zona = {}
+        self.posicion = 0
+        self.cabecera = None
+        self.inodo = None
+        self.bloqueo = threading.Lock()
+
+    # Función para reconstruir el índice desde cero (por ejemplo, si el historial se ha reescrito o compactado)
+    def reiniciar(self):
+        self.ingresos = []
+        self.ingresos_por_zona = {}
+        self.posicion = 0
+        self.cabecera = None
+        self.inodo = None
+
+        # Las búsquedas compactadas ya no están en el historial activo, se leen una vez del archivo comprimido
+        archivado = leer_archivo(self.directorio_archivo) if os.path.isdir(self.directorio_archivo) else None
+        if archivado is not None:
+            archivado = archivado.dropna(subset=['Ingresos', 'Zona'])
+            self.agregar(archivado['Zona'].tolist(), archivado['Ingresos'].astype(float).tolist())
+
+    # Función para añadir al índice las búsquedas registradas desde la última actualización
+    def actualizar(self):
+        with self.bloqueo:
+            if not os.path.exists(self.ruta):
+                self.reiniciar()
+                return
+            # La compactación sustituye el archivo, así que un cambio de inodo obliga a reconstruir el índice
+            estado = os.stat(self.ruta)
+            if estado.st_ino != self.inodo or estado.st_size < self.posicion:
+                self.reiniciar()
+
+            with open(self.ruta, 'rb') as f:
+                cabecera = f.readline()
+                if cabecera != self.cabecera:
+                    if self.cabecera is not None:
+                        self.reiniciar()
+                    self.cabecera = cabecera
+                    self.inodo = estado.st_ino
+                    self.posicion = f.tell()
+                f.seek(self.posicion)
+                lineas = f.read()
+                # Solo se procesan las líneas completas; una línea a medio escribir se leerá en la próxima actualización
+                completas = lineas[:lineas.rfind(b'\n') + 1]
+                self.posicion += len(completas)
+
+            if not completas:
+                return
+            nuevas = pd.read_csv(io.BytesIO(cabecera + completas))
+            nuevas = nuevas.dropna(subset=['Ingresos', 'Zona'])
+            self.agregar(nuevas['Zona'].tolist(), nuevas['Ingresos'].astype(float).tolist())
+
+    # Función para insertar ingresos en las listas ordenadas
+    def agregar(self, zonas, ingresos):
+        fusionar_en_bloque = len(ingresos) > TAMANO_FUSION
+        if fusionar_en_bloque:
+            self.ingresos.extend(ingresos)
+            self.ingresos.sort()
+        nuevos_por_zona = {}
+        for zona, valor in zip(zonas, ingresos):
+            if not fusionar_en_bloque:
+                insort(self.ingresos, valor)
+            nuevos_por_zona.setdefault(zona, []).append(valor)
+
+        for zona, valores in nuevos_por_zona.items():
+            lista = self.ingresos_por_zona.setdefault(zona, [])
+            if len(valores) > TAMANO_FUSION:
+                lista.extend(valores)
+                lista.sort()
+            else:
+                for valor in valores:
+                    insort(lista, valor)
+
+    # Función para calcular la proporción de búsquedas con ingresos superiores a un umbral
+    def proporcion_por_encima(self, umbral, zona=None):
+        with self.bloqueo:
+            lista = self.ingresos if zona is None else self.ingresos_por_zona.get(zona, [])
+            if not lista:
+                return None
+            return (len(lista) - bisect_right(lista, umbral)) / len(lista)
+
+    # Función para calcular el porcentaje de usuarios que podrían permitirse una vivienda de un precio dado
+    def porcentaje_asequible(self, valor_compra, zona=None, umbral_porcentaje=UMBRAL_VIABLE):
+        hipoteca_mensual = calcular_hipoteca(valor_compra, TASA_INTERES, PLAZO_ANIOS)
+        ingresos_minimos = hipoteca_mensual * 12 / (umbral_porcentaje / 100)
+        proporcion = self.proporcion_por_encima(ingresos_minimos, zona)
+        return None if proporcion is None else proporcion * 100
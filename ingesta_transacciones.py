@@ -0,0 +1,215 @@
+import argparse
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cuantiles import ARCHIVO_CUANTILES, CLAVES_CUANTILES, cubos
+from datos import ARCHIVO_DATOS, required_columns
+
+# Columnas de los archivos de compraventas (una fila por transacción) que se usan en la ingesta. El código de
+# municipio (INE, cuyos dos primeros dígitos son la provincia) identifica la zona: hay nombres de municipio
+# repetidos en distintas provincias.
+COLUMNAS_TRANSACCIONES = ['Código municipio', 'Municipio', 'Fecha', 'Precio', 'Superficie', 'Tipo de vivienda',
+                          'Latitud', 'Longitud']
+
+# Filas que se leen de cada vez y tamaño de los fragmentos de archivo que procesa cada proceso,
+# de modo que la memoria usada no depende del tamaño de los archivos
+TAMANO_BLOQUE = 500_000
+TAMANO_FRAGMENTO = 256 * 1024 * 1024
+
+# Años de variación anual que se promedian para proyectar el precio a 5 años
+ANIOS_PROYECCION = 3
+
+# Claves de agregación y sumas parciales que se acumulan por clave (se pueden sumar entre bloques y procesos)
+CLAVES = ['Código municipio', 'Año', 'Tipo de vivienda']
+SUMAS = ['Transacciones', 'Suma precio', 'Suma superficie', 'Coordenadas', 'Suma latitud', 'Suma longitud']
+
+# Claves de las cuentas de cuantiles durante la ingesta (con el código de municipio en lugar del nombre) y de
+# las cuentas de nombres de cada municipio
+CLAVES_CUENTAS = ['Código municipio'] + CLAVES_CUANTILES[1:]
+CLAVES_NOMBRES = ['Código municipio', 'Ciudad']
+
+
+# Lector que limita un archivo binario al fragmento [inicio, fin)
+class LectorFragmento(io.RawIOBase):
+    def __init__(self, archivo, inicio, fin):
+        self.archivo = archivo
+        self.archivo.seek(inicio)
+        self.restantes = fin - inicio
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        datos = self.archivo.read(min(len(buffer), self.restantes))
+        self.restantes -= len(datos)
+        buffer[:len(datos)] = datos
+        return len(datos)
+
+
+# Función para dividir un archivo en fragmentos que empiezan y terminan en un salto de línea
+def dividir_archivo(ruta, tamano_fragmento=TAMANO_FRAGMENTO):
+    tamano = os.path.getsize(ruta)
+    with open(ruta, 'rb') as f:
+        cabecera = f.readline()
+        limites = [f.tell()]
+        while limites[-1] < tamano:
+            f.seek(min(limites[-1] + tamano_fragmento, tamano))
+            f.readline()
+            limites.append(min(f.tell(), tamano))
+    return cabecera, list(zip(limites[:-1], limites[1:]))
+
+
+# Función para convertir un bloque de transacciones en sumas parciales por municipio, año y tipo de vivienda, en
+# las cuentas de su resumen de cuantiles del precio por m² y en las cuentas de los nombres de cada municipio
+def agregar_bloque(bloque, decimal):
+    bloque.columns = bloque.columns.str.strip()
+    numericas = {}
+    for columna in ['Precio', 'Superficie', 'Latitud', 'Longitud']:
+        valores = bloque[columna]
+        if decimal != '.' and valores.dtype == object:
+            valores = valores.str.replace(decimal, '.', regex=False)
+        numericas[columna] = pd.to_numeric(valores, errors='coerce')
+
+    transacciones = pd.DataFrame({
+        'Código municipio': bloque['Código municipio'].str.strip().replace('', None),
+        'Ciudad': bloque['Municipio'].str.strip(),
+        'Año': pd.to_datetime(bloque['Fecha'], errors='coerce').dt.year,
+        'Tipo de vivienda': bloque['Tipo de vivienda'].str.strip(),
+        'Transacciones': 1,
+        'Suma precio': numericas['Precio'],
+        'Suma superficie': numericas['Superficie'],
+    })
+    # Se descartan las transacciones sin municipio, fecha, tipo o con precio o superficie no válidos
+    validas = (transacciones[CLAVES + ['Ciudad']].notna().all(axis=1)
+               & (transacciones['Suma precio'] > 0) & (transacciones['Suma superficie'] > 0))
+    con_coordenadas = numericas['Latitud'].notna() & numericas['Longitud'].notna()
+    transacciones['Coordenadas'] = con_coordenadas.astype(int)
+    transacciones['Suma latitud'] = numericas['Latitud'].where(con_coordenadas, 0.0)
+    transacciones['Suma longitud'] = numericas['Longitud'].where(con_coordenadas, 0.0)
+    transacciones = transacciones[validas]
+    cuentas = (transacciones[CLAVES]
+               .assign(Cubo=cubos(transacciones['Suma precio'] / transacciones['Suma superficie']))
+               .groupby(CLAVES_CUENTAS + ['Cubo']).size().to_frame('Cuenta'))
+    nombres = transacciones.groupby(CLAVES_NOMBRES)[['Transacciones']].sum()
+    return transacciones.groupby(CLAVES)[SUMAS].sum(), cuentas, nombres
+
+
+# Función que recorre un fragmento de archivo por bloques y devuelve sus sumas parciales
+def procesar_fragmento(ruta, cabecera, inicio, fin, separador, decimal, tamano_bloque=TAMANO_BLOQUE):
+    nombres = [nombre.strip() for nombre in cabecera.decode('utf-8-sig').rstrip('\r\n').split(separador)]
+    with open(ruta, 'rb') as f:
+        lector = io.BufferedReader(LectorFragmento(f, inicio, fin))
+        bloques = pd.read_csv(lector, sep=separador, header=None, names=nombres, usecols=COLUMNAS_TRANSACCIONES,
+                              dtype=str, chunksize=tamano_bloque, encoding='utf-8')
+        return combinar_bloques([agregar_bloque(bloque, decimal) for bloque in bloques])
+
+
+# Función que recorre por bloques un archivo comprimido (no se puede dividir en fragmentos)
+def procesar_comprimido(ruta, separador, decimal, tamano_bloque=TAMANO_BLOQUE):
+    bloques = pd.read_csv(ruta, sep=separador, usecols=lambda columna: columna.strip() in COLUMNAS_TRANSACCIONES,
+                          dtype=str, chunksize=tamano_bloque, encoding='utf-8-sig')
+    return combinar_bloques([agregar_bloque(bloque, decimal) for bloque in bloques])
+
+
+# Función para sumar los resultados parciales (sumas o cuentas) de varios bloques o procesos
+def combinar(parciales, claves=CLAVES, columnas=SUMAS):
+    parciales = [parcial for parcial in parciales if not parcial.empty]
+    if not parciales:
+        return pd.DataFrame(columns=columnas, index=pd.MultiIndex.from_arrays([[]] * len(claves), names=claves))
+    return pd.concat(parciales).groupby(level=claves).sum()
+
+
+# Función para combinar por separado las sumas, las cuentas de cuantiles y las de nombres de varios bloques o procesos
+def combinar_bloques(resultados):
+    sumas = [suma for suma, _, _ in resultados]
+    cuentas = [cuenta for _, cuenta, _ in resultados]
+    nombres = [nombre for _, _, nombre in resultados]
+    return (combinar(sumas), combinar(cuentas, CLAVES_CUENTAS + ['Cubo'], ['Cuenta']),
+            combinar(nombres, CLAVES_NOMBRES, ['Transacciones']))
+
+
+# Función para elegir el nombre de cada municipio (el más frecuente en sus transacciones). Los nombres que se
+# repiten en varios municipios se distinguen con el código de provincia o, si coinciden también en la provincia,
+# con el código de municipio, para que cada zona del dataset tenga un nombre único.
+def nombres_municipios(nombres):
+    base = (nombres['Transacciones'].sort_values(ascending=False, kind='stable').reset_index()
+            .drop_duplicates('Código municipio').set_index('Código municipio')['Ciudad'].sort_index())
+    codigos = base.index.to_series()
+    unicos = base.where(~base.duplicated(keep=False), base + ' (' + codigos.str[:2] + ')')
+    return unicos.where(~unicos.duplicated(keep=False), base + ' (' + codigos + ')')
+
+
+# Función para calcular las columnas del dataset a partir de las sumas por municipio, año y tipo de vivienda
+def calcular_indicadores(sumas, nombres):
+    datos = sumas.reset_index()
+    datos['Ciudad'] = datos['Código municipio'].map(nombres)
+    datos = datos.sort_values(['Ciudad', 'Año', 'Tipo de vivienda']).reset_index(drop=True)
+    datos['Año'] = datos['Año'].astype(int)
+    datos['Precio medio/m²'] = datos['Suma precio'] / datos['Suma superficie']
+    datos['Valor medio de compra'] = datos['Suma precio'] / datos['Transacciones']
+
+    # Variación respecto al año anterior de la misma zona y tipo (solo si el año anterior tiene datos)
+    grupos = datos.groupby(['Ciudad', 'Tipo de vivienda'])
+    anterior = grupos['Precio medio/m²'].shift()
+    consecutivo = grupos['Año'].diff() == 1
+    datos['Variación anual (%)'] = ((datos['Precio medio/m²'] / anterior - 1) * 100).where(consecutivo)
+
+    # Proyección a 5 años con la variación media de los últimos años
+    variacion_media = grupos['Variación anual (%)'].transform(
+        lambda serie: serie.rolling(ANIOS_PROYECCION, min_periods=1).mean()
+    )
+    datos['Proyección 5 años (%)'] = ((1 + variacion_media / 100) ** 5 - 1) * 100
+
+    # Coordenadas medias de la zona (de todas sus transacciones con coordenadas)
+    por_zona = datos.groupby('Ciudad')[['Coordenadas', 'Suma latitud', 'Suma longitud']].transform('sum')
+    coordenadas = por_zona['Coordenadas'].replace(0, np.nan)
+    datos['Latitud'] = por_zona['Suma latitud'] / coordenadas
+    datos['Longitud'] = por_zona['Suma longitud'] / coordenadas
+    return datos[required_columns].round(4)
+
+
+# Función para generar el dataset de vivienda a partir de los archivos de transacciones
+def ingerir(rutas, salida=ARCHIVO_DATOS, salida_cuantiles=ARCHIVO_CUANTILES, separador=';', decimal='.', procesos=None,
+            tamano_fragmento=TAMANO_FRAGMENTO, tamano_bloque=TAMANO_BLOQUE):
+    with ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+        tareas = []
+        for ruta in rutas:
+            if ruta.endswith('.gz'):
+                tareas.append(pool.submit(procesar_comprimido, ruta, separador, decimal, tamano_bloque))
+                continue
+            cabecera, fragmentos = dividir_archivo(ruta, tamano_fragmento)
+            for inicio, fin in fragmentos:
+                tareas.append(pool.submit(procesar_fragmento, ruta, cabecera, inicio, fin, separador, decimal,
+                                          tamano_bloque))
+        sumas, cuentas, nombres = combinar_bloques([tarea.result() for tarea in tareas])
+
+    nombres = nombres_municipios(nombres)
+    datos = calcular_indicadores(sumas, nombres)
+    datos.to_csv(salida, sep=';', index=False)
+    cuentas = cuentas.reset_index().astype({'Año': int})
+    cuentas['Ciudad'] = cuentas['Código municipio'].map(nombres)
+    cuentas[CLAVES_CUANTILES + ['Cubo', 'Cuenta']].to_csv(salida_cuantiles, sep=';', index=False)
+    return datos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Genera el dataset de vivienda agregando archivos de compraventas por zona, año y tipo."
+    )
+    parser.add_argument('archivos', nargs='+', help="Archivos CSV de transacciones (pueden estar comprimidos en .gz)")
+    parser.add_argument('--salida', default=ARCHIVO_DATOS, help="Archivo del dataset generado")
+    parser.add_argument('--salida-cuantiles', default=ARCHIVO_CUANTILES,
+                        help="Archivo con los resúmenes de cuantiles del precio por m²")
+    parser.add_argument('--separador', default=';', help="Separador de columnas de los archivos de transacciones")
+    parser.add_argument('--decimal', default='.', help="Separador decimal de los archivos de transacciones")
+    parser.add_argument('--procesos', type=int, default=None, help="Número de procesos (por defecto, uno por núcleo)")
+    parser.add_argument('--bloque', type=int, default=TAMANO_BLOQUE, help="Filas leídas de cada vez")
+    args = parser.parse_args()
+
+    datos = ingerir(args.archivos, salida=args.salida, salida_cuantiles=args.salida_cuantiles, separador=args.separador, decimal=args.decimal,
+                    procesos=args.procesos, tamano_bloque=args.bloque)
+    print(f"Filas generadas: {len(datos)} ({datos['Ciudad'].nunique()} zonas) en {args.salida}")
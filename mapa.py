@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from datos import PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca, codigos_viabilidad
+
+# Alto del mapa en píxeles
+ALTO_MAPA = 400
+
+# Colores, textos y leyenda de la capa de viabilidad
+COLORES_VIABILIDAD = {0: 'gray', 1: 'green', 2: 'orange', 3: 'red'}
+TEXTOS_VIABILIDAD = {0: 'Sin datos', 1: 'Viable', 2: 'Moderadamente viable', 3: 'No viable'}
+LEYENDA_VIABILIDAD = [
+    ['green', 'Viable (< 30% de ingresos)'],
+    ['orange', 'Moderadamente viable (30%-50% de ingresos)'],
+    ['red', 'No viable (> 50% de ingresos)'],
+    ['gray', 'Sin datos disponibles'],
+]
+
+# Código de las zonas sin segmento de mercado
+SIN_SEGMENTO = -1
+
+
+# Función para descartar las geometrías que no son válidas
+def geometrias_validas(gdf):
+    return gdf[gdf.geometry.is_valid].reset_index(drop=True)
+
+
+# Función para obtener los atributos de las zonas del mapa (sin la geometría), en el mismo orden que las geometrías.
+# Es lo único que necesitan las capas y los precios de las zonas, que no dibujan nada.
+def zonas_mapa(gdf):
+    return pd.DataFrame(gdf[['mun_name']]).reset_index(drop=True)
+
+
+# Función para generar el GeoJSON que se envía al navegador: nombre, posición, geometría y detalle del
+# tooltip (mini-gráfica de tendencia e indicadores) de cada zona
+def geometrias_geojson(gdf, detalles=None):
+    zonas = gdf[['mun_name', 'geometry']].copy()
+    zonas['indice'] = np.arange(len(zonas))
+    zonas['detalle'] = zonas['mun_name'].map(detalles or {}).fillna('')
+    return zonas.to_json()
+
+
+# Función para obtener el valor medio de compra de cada zona en el mismo orden que las geometrías
+def precios_zonas(zonas, df):
+    precios = df.groupby('Ciudad')['Valor medio de compra'].mean()
+    return zonas['mun_name'].map(precios).to_numpy(dtype=float)
+
+
+# Función para calcular el código de viabilidad de cada zona para unos ingresos dados
+def viabilidad_zonas(precios, ingresos):
+    hipotecas = calcular_hipoteca(precios, TASA_INTERES, PLAZO_ANIOS)
+    return codigos_viabilidad(hipotecas, ingresos).tolist()
+
+
+# Función para obtener el segmento de mercado de cada zona en el mismo orden que las geometrías
+def segmentos_zonas(zonas, segmentos):
+    codigos = zonas['mun_name'].map(segmentos.set_index('Ciudad')['Segmento'])
+    return codigos.fillna(SIN_SEGMENTO).astype(int).tolist()
+
+
+# Función para preparar la capa de viabilidad que se envía al mapa
+def capa_viabilidad(viabilidad):
+    return {
+        'etiqueta': 'Viabilidad',
+        'titulo': 'Viabilidad de compra',
+        'valores': viabilidad,
+        'colores': COLORES_VIABILIDAD,
+        'textos': TEXTOS_VIABILIDAD,
+        'leyenda': LEYENDA_VIABILIDAD,
+    }
+
+
+# Función para preparar la capa de segmentos de mercado que se envía al mapa
+def capa_segmentos(codigos, nombres, colores):
+    return {
+        'etiqueta': 'Segmento',
+        'titulo': 'Segmento de mercado',
+        'valores': codigos,
+        'colores': {**colores, SIN_SEGMENTO: 'gray'},
+        'textos': {**nombres, SIN_SEGMENTO: 'Sin datos'},
+        'leyenda': [[colores[codigo], nombre] for codigo, nombre in nombres.items()] + [['gray', 'Sin datos disponibles']],
+    }
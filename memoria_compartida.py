@@ -0,0 +1,156 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from evolucion_viabilidad import hipotecas_anuales
+from mapa import geometrias_geojson, geometrias_validas, precios_zonas, zonas_mapa
+from particiones import (DIRECTORIO_PARTICIONES, cargar_datos_provincia, cargar_geometrias_provincia, cargar_indice,
+                         firma_origen, limpiar_versiones, version_datos, version_origen, versiones_en_uso)
+from sparklines import detalles_zonas
+
+# Directorio con los datos ya procesados de cada versión en archivos que los procesos de la aplicación mapean en
+# memoria de solo lectura. Así todas las réplicas de un mismo equipo comparten las mismas páginas de memoria y
+# una réplica nueva arranca sin leer ni procesar ningún CSV o GeoJSON.
+DIRECTORIO_MEMORIA = os.path.join(DIRECTORIO_PARTICIONES, 'memoria')
+USAR_MEMORIA_COMPARTIDA = os.environ.get('TFM_MEMORIA_COMPARTIDA', '0') == '1'
+ARCHIVO_META = 'meta.json'
+
+
+# Función para guardar una tabla en columnas: las numéricas como arrays .npy y las de texto como códigos de
+# categoría (también .npy) con la lista de categorías en el archivo de metadatos
+def guardar_tabla(df, destino):
+    os.makedirs(destino, exist_ok=True)
+    columnas = []
+    for posicion, columna in enumerate(df.columns):
+        archivo = f'{posicion}.npy'
+        if pd.api.types.is_numeric_dtype(df[columna]):
+            np.save(os.path.join(destino, archivo), df[columna].to_numpy())
+            columnas.append({'nombre': columna, 'archivo': archivo})
+        else:
+            categorias = df[columna].astype('category')
+            np.save(os.path.join(destino, archivo), categorias.cat.codes.to_numpy())
+            columnas.append({'nombre': columna, 'archivo': archivo,
+                             'categorias': categorias.cat.categories.astype(str).tolist()})
+    with open(os.path.join(destino, ARCHIVO_META), 'w', encoding='utf-8') as f:
+        json.dump({'filas': len(df), 'columnas': columnas}, f, ensure_ascii=False)
+
+
+# Función para cargar una tabla guardada con guardar_tabla. Las columnas numéricas quedan mapeadas en memoria
+# (sin copiarlas); las de texto se reconstruyen a partir de sus códigos con el mismo tipo que al leer el CSV.
+def cargar_tabla(origen):
+    with open(os.path.join(origen, ARCHIVO_META), encoding='utf-8') as f:
+        meta = json.load(f)
+    columnas = {}
+    for columna in meta['columnas']:
+        valores = np.load(os.path.join(origen, columna['archivo']), mmap_mode='r')
+        if 'categorias' in columna:
+            categorias = pd.Series(columna['categorias'] + [None], dtype=str)
+            valores = categorias.take(valores).reset_index(drop=True)
+        columnas[columna['nombre']] = valores
+    return pd.DataFrame(columnas, index=pd.RangeIndex(meta['filas']), copy=False)
+
+
+# Función para mapear en memoria un archivo binario completo (solo lectura)
+def mapear_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Función para guardar todos los datos procesados de una provincia. Las geometrías solo se guardan ya convertidas
+# en el GeoJSON del mapa, que es lo único que las dibuja; el resto usa los atributos de las zonas.
+def exportar_provincia(prov_code, version, destino, directorio_particiones=DIRECTORIO_PARTICIONES):
+    df = cargar_datos_provincia(prov_code, version, directorio_particiones)
+    gdf = geometrias_validas(cargar_geometrias_provincia(prov_code, version, directorio_particiones))
+    guardar_tabla(df, os.path.join(destino, 'datos'))
+    guardar_tabla(zonas_mapa(gdf), os.path.join(destino, 'zonas'))
+
+    # GeoJSON que se envía al navegador, tal cual
+    with open(os.path.join(destino, 'mapa.geojson'), 'w', encoding='utf-8') as f:
+        f.write(geometrias_geojson(gdf, detalles_zonas(df)))
+
+    # Arrays agregados: valor medio de compra por zona del mapa e hipotecas por tipo, zona y año
+    np.save(os.path.join(destino, 'precios_zonas.npy'), precios_zonas(gdf, df))
+    hipotecas = hipotecas_anuales(df)
+    np.save(os.path.join(destino, 'hipotecas_anuales.npy'), hipotecas.pop('hipotecas'))
+    with open(os.path.join(destino, 'hipotecas_anuales.json'), 'w', encoding='utf-8') as f:
+        json.dump(hipotecas, f, ensure_ascii=False)
+
+
+# Función para preparar los archivos mapeables de la versión actual de los datos. Si ya existen (por ejemplo,
+# porque los ha generado otra réplica) solo se devuelve su ruta. Se generan en un directorio temporal que se
+# renombra al terminar, para que ningún proceso vea una versión a medio escribir. Las versiones anteriores no
+# se borran aquí, porque otras réplicas pueden seguir abriendo sus archivos (las borra limpiar_memoria).
+def preparar_memoria(indice, directorio=DIRECTORIO_MEMORIA, directorio_particiones=DIRECTORIO_PARTICIONES):
+    version = version_datos(indice)
+    ruta = os.path.join(directorio, version)
+    if os.path.isdir(ruta):
+        return ruta
+
+    temporal = f'{ruta}.tmp-{os.getpid()}'
+    shutil.rmtree(temporal, ignore_errors=True)
+    for prov_code in indice['provincias']:
+        exportar_provincia(prov_code, version, os.path.join(temporal, prov_code), directorio_particiones)
+    try:
+        os.rename(temporal, ruta)
+    except OSError:
+        # Otra réplica ha terminado antes con la misma versión
+        shutil.rmtree(temporal, ignore_errors=True)
+        if not os.path.isdir(ruta):
+            raise
+    return ruta
+
+
+# Función para borrar las versiones de los archivos mapeables y de las particiones que no son la actual ni las
+# lee ningún proceso (cargar_indice registra cada proceso como lector de su versión)
+def limpiar_memoria(directorio=DIRECTORIO_MEMORIA, directorio_particiones=DIRECTORIO_PARTICIONES):
+    conservar = versiones_en_uso(directorio_particiones) | {version_origen(firma_origen())}
+    return limpiar_versiones(directorio, conservar) + limpiar_versiones(directorio_particiones, conservar)
+
+
+# Funciones para cargar los datos de una provincia desde los archivos mapeados
+def cargar_datos_memoria(ruta, prov_code):
+    return cargar_tabla(os.path.join(ruta, prov_code, 'datos'))
+
+
+def cargar_zonas_memoria(ruta, prov_code):
+    return cargar_tabla(os.path.join(ruta, prov_code, 'zonas'))
+
+
+def ruta_geometrias_mapa_memoria(ruta, prov_code):
+    return os.path.join(ruta, prov_code, 'mapa.geojson')
+
+
+def cargar_geometrias_mapa_memoria(ruta, prov_code):
+    return bytes(mapear_archivo(ruta_geometrias_mapa_memoria(ruta, prov_code))).decode('utf-8')
+
+
+def cargar_precios_zonas_memoria(ruta, prov_code):
+    return np.load(os.path.join(ruta, prov_code, 'precios_zonas.npy'), mmap_mode='r')
+
+
+def cargar_hipotecas_anuales_memoria(ruta, prov_code):
+    with open(os.path.join(ruta, prov_code, 'hipotecas_anuales.json'), encoding='utf-8') as f:
+        hipotecas = json.load(f)
+    hipotecas['hipotecas'] = np.load(os.path.join(ruta, prov_code, 'hipotecas_anuales.npy'), mmap_mode='r')
+    return hipotecas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera los archivos mapeables en memoria de la versión actual de los datos.")
+    parser.add_argument('--directorio', default=DIRECTORIO_MEMORIA, help="Directorio de los archivos mapeables")
+    parser.add_argument('--limpiar', action='store_true',
+                        help="Borrar las versiones anteriores que ya no usa ninguna réplica")
+    args = parser.parse_args()
+
+    if args.limpiar:
+        borradas = limpiar_memoria(args.directorio)
+        print(f"Versiones borradas: {', '.join(borradas) if borradas else 'ninguna'}")
+    else:
+        print(f"Archivos mapeables en {preparar_memoria(cargar_indice(), args.directorio)}")
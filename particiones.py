@@ -0,0 +1,227 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import geopandas as gpd
+import pandas as pd
+
+from cuantiles import ARCHIVO_CUANTILES, leer_cuantiles
+from datos import ARCHIVO_DATOS, ARCHIVO_GEOJSON, columnas_faltantes, limpiar_datos
+
+# Directorio donde se guardan los datos y geometrías particionados por provincia (prov_code). Cada versión de los
+# datos de origen tiene su propio subdirectorio con su índice, que se escribe completo antes de hacerse visible.
+DIRECTORIO_PARTICIONES = 'particiones'
+ARCHIVO_INDICE = 'indice.json'
+
+# Directorio con un archivo bloqueado por cada proceso que lee una versión de los datos, para que la limpieza
+# solo borre las versiones que ya no lee nadie
+DIRECTORIO_LECTORES = 'lectores'
+lectores = {}
+
+# Provincia que se muestra por defecto (Sevilla)
+PROVINCIA_POR_DEFECTO = '41'
+
+
+# Función para obtener la firma (tamaño y fecha de modificación) de los archivos de origen. Los resúmenes de
+# cuantiles de la ingesta son opcionales y solo forman parte de la firma si existen.
+def firma_origen(ruta_datos=ARCHIVO_DATOS, ruta_geojson=ARCHIVO_GEOJSON, ruta_cuantiles=ARCHIVO_CUANTILES):
+    firma = {}
+    for ruta in [ruta_datos, ruta_geojson, ruta_cuantiles]:
+        if ruta == ruta_cuantiles and not os.path.exists(ruta):
+            continue
+        estado = os.stat(ruta)
+        firma[os.path.basename(ruta)] = [estado.st_size, int(estado.st_mtime)]
+    return firma
+
+
+# Función para obtener un identificador corto de la versión de los datos a partir de la firma de los archivos de origen
+def version_origen(origen):
+    firma = json.dumps(origen, sort_keys=True)
+    return hashlib.sha1(firma.encode('utf-8')).hexdigest()[:12]
+
+
+# Función para obtener la versión de los datos a partir del índice de particiones
+def version_datos(indice):
+    return version_origen(indice['origen'])
+
+
+# Función para obtener el directorio de las particiones de una versión de los datos
+def directorio_version(version, directorio=DIRECTORIO_PARTICIONES):
+    return os.path.join(directorio, version)
+
+
+# Función para obtener las rutas de los archivos de una partición dentro del directorio de su versión
+def rutas_particion(prov_code, ruta_version):
+    return (os.path.join(ruta_version, 'datos', f'{prov_code}.csv'),
+            os.path.join(ruta_version, 'geometrias', f'{prov_code}.geojson'),
+            os.path.join(ruta_version, 'cuantiles', f'{prov_code}.csv'))
+
+
+# Función para asignar a cada fila del dataset la provincia en la que se encuentran sus coordenadas
+def asignar_provincias(df, gdf):
+    coordenadas = df[['Latitud', 'Longitud']].drop_duplicates().dropna()
+    puntos = gpd.GeoDataFrame(
+        coordenadas,
+        geometry=gpd.points_from_xy(coordenadas['Longitud'], coordenadas['Latitud']),
+        crs=gdf.crs
+    )
+
+    # Se usa el municipio más cercano para que los puntos situados en el borde no queden sin provincia
+    asignacion = gpd.sjoin_nearest(puntos.to_crs(3857), gdf[['prov_code', 'geometry']].to_crs(3857), how='left')
+    asignacion = asignacion[~asignacion.index.duplicated()]
+
+    return df.merge(
+        asignacion[['Latitud', 'Longitud', 'prov_code']],
+        on=['Latitud', 'Longitud'],
+        how='left'
+    )['prov_code']
+
+
+# Función para dividir el dataset y el GeoJSON en particiones por provincia. Se escriben en un directorio temporal
+# que se renombra al terminar, para que ningún proceso vea una partición a medio escribir o un índice que apunte
+# a archivos que todavía no existen.
+def construir_particiones(ruta_datos=ARCHIVO_DATOS, ruta_geojson=ARCHIVO_GEOJSON, directorio=DIRECTORIO_PARTICIONES,
+                          ruta_cuantiles=ARCHIVO_CUANTILES):
+    origen = firma_origen(ruta_datos, ruta_geojson, ruta_cuantiles)
+    gdf = gpd.read_file(ruta_geojson)
+    df = pd.read_csv(ruta_datos, sep=';')
+    df.columns = df.columns.str.strip()
+    faltantes = columnas_faltantes(df)
+    if faltantes:
+        raise ValueError(f"El dataset no contiene las columnas requeridas: {', '.join(faltantes)}")
+    df = limpiar_datos(df)
+    df['prov_code'] = asignar_provincias(df, gdf).values
+
+    # Los resúmenes de cuantiles de la ingesta van a la provincia de las filas de su zona (la ingesta da a cada
+    # zona un nombre único), de modo que cada provincia solo lee los suyos
+    cuantiles = leer_cuantiles(ruta_cuantiles)
+    if cuantiles is not None:
+        cuantiles = cuantiles.merge(df[['Ciudad', 'prov_code']].drop_duplicates('Ciudad'), on='Ciudad')
+
+    ruta_version = directorio_version(version_origen(origen), directorio)
+    temporal = f'{ruta_version}.tmp-{os.getpid()}'
+    shutil.rmtree(temporal, ignore_errors=True)
+    for subdirectorio in ['datos', 'geometrias', 'cuantiles']:
+        os.makedirs(os.path.join(temporal, subdirectorio))
+
+    provincias = {}
+    for prov_code, gdf_provincia in gdf.groupby('prov_code'):
+        ruta_csv, ruta_geo, ruta_cuantiles_provincia = rutas_particion(prov_code, temporal)
+        df_provincia = df[df['prov_code'] == prov_code].drop(columns='prov_code')
+        df_provincia.to_csv(ruta_csv, sep=';', index=False)
+        gdf_provincia.to_file(ruta_geo, driver='GeoJSON')
+        if cuantiles is not None:
+            cuantiles[cuantiles['prov_code'] == prov_code].drop(columns='prov_code').to_csv(
+                ruta_cuantiles_provincia, sep=';', index=False
+            )
+
+        minx, miny, maxx, maxy = gdf_provincia.total_bounds
+        provincias[prov_code] = {
+            'nombre': gdf_provincia['prov_name'].iloc[0],
+            'limites': [[miny, minx], [maxy, maxx]],
+            'centro': [(miny + maxy) / 2, (minx + maxx) / 2],
+            'municipios': len(gdf_provincia),
+            'filas': len(df_provincia),
+        }
+
+    indice = {'origen': origen, 'provincias': provincias}
+    with open(os.path.join(temporal, ARCHIVO_INDICE), 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False, indent=2)
+    try:
+        os.rename(temporal, ruta_version)
+    except OSError:
+        # Otro proceso ha terminado antes las particiones de la misma versión
+        shutil.rmtree(temporal, ignore_errors=True)
+        if not os.path.isdir(ruta_version):
+            raise
+    return indice
+
+
+# Función para registrar el proceso como lector de una versión de los datos. El archivo del proceso queda
+# bloqueado (en modo compartido) hasta que el proceso termina, también si termina de forma inesperada.
+def registrar_lector(version, directorio=DIRECTORIO_PARTICIONES):
+    if (version, directorio) in lectores:
+        return
+    ruta_lectores = os.path.join(directorio, DIRECTORIO_LECTORES)
+    os.makedirs(ruta_lectores, exist_ok=True)
+    ruta = os.path.join(ruta_lectores, f'{version}.{os.getpid()}')
+    while True:
+        f = open(ruta, 'w')
+        fcntl.flock(f, fcntl.LOCK_SH)
+        # La limpieza puede haber borrado el archivo entre que se abre y se bloquea: en ese caso se crea de nuevo
+        if os.path.exists(ruta) and os.path.samefile(ruta, f.fileno()):
+            break
+        f.close()
+    lectores.setdefault((version, directorio), f)
+
+
+# Función para obtener las versiones que algún proceso sigue leyendo. Los archivos de los procesos que ya han
+# terminado no tienen bloqueo y se borran.
+def versiones_en_uso(directorio=DIRECTORIO_PARTICIONES):
+    en_uso = set()
+    ruta_lectores = os.path.join(directorio, DIRECTORIO_LECTORES)
+    if not os.path.isdir(ruta_lectores):
+        return en_uso
+    for nombre in os.listdir(ruta_lectores):
+        ruta = os.path.join(ruta_lectores, nombre)
+        with open(ruta, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                en_uso.add(nombre.rsplit('.', 1)[0])
+            else:
+                os.remove(ruta)
+    return en_uso
+
+
+# Función para borrar los directorios de versión de un directorio que no están entre las versiones a conservar
+def limpiar_versiones(directorio, conservar):
+    borradas = []
+    if not os.path.isdir(directorio):
+        return borradas
+    for nombre in sorted(os.listdir(directorio)):
+        if re.fullmatch(r'[0-9a-f]{12}', nombre) and nombre not in conservar:
+            shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+            borradas.append(nombre)
+    return borradas
+
+
+# Función para cargar el índice de particiones de la versión actual de los datos de origen, construyéndolas si
+# todavía no existen. El proceso queda registrado como lector de la versión, así que las versiones anteriores
+# solo las borra limpiar_versiones cuando ninguna réplica las usa.
+def cargar_indice(ruta_datos=ARCHIVO_DATOS, ruta_geojson=ARCHIVO_GEOJSON, directorio=DIRECTORIO_PARTICIONES,
+                  ruta_cuantiles=ARCHIVO_CUANTILES):
+    origen = firma_origen(ruta_datos, ruta_geojson, ruta_cuantiles)
+    registrar_lector(version_origen(origen), directorio)
+    ruta_indice = os.path.join(directorio_version(version_origen(origen), directorio), ARCHIVO_INDICE)
+    if os.path.exists(ruta_indice):
+        with open(ruta_indice, encoding='utf-8') as f:
+            return json.load(f)
+    return construir_particiones(ruta_datos, ruta_geojson, directorio, ruta_cuantiles)
+
+
+# Función para cargar los datos de vivienda de una provincia en una versión de los datos
+def cargar_datos_provincia(prov_code, version, directorio=DIRECTORIO_PARTICIONES):
+    ruta_csv, _, _ = rutas_particion(prov_code, directorio_version(version, directorio))
+    return limpiar_datos(pd.read_csv(ruta_csv, sep=';'))
+
+
+# Función para cargar las geometrías de los municipios de una provincia en una versión de los datos
+def cargar_geometrias_provincia(prov_code, version, directorio=DIRECTORIO_PARTICIONES):
+    _, ruta_geo, _ = rutas_particion(prov_code, directorio_version(version, directorio))
+    return gpd.read_file(ruta_geo)
+
+
+# Función para cargar los resúmenes de cuantiles de la ingesta de una provincia (None si no se generaron)
+def cargar_cuantiles_provincia(prov_code, version, directorio=DIRECTORIO_PARTICIONES):
+    _, _, ruta_cuantiles = rutas_particion(prov_code, directorio_version(version, directorio))
+    return leer_cuantiles(ruta_cuantiles)
+
+
+if __name__ == '__main__':
+    indice = construir_particiones()
+    for prov_code, provincia in sorted(indice['provincias'].items()):
+        print(f"{prov_code} {provincia['nombre']}: {provincia['municipios']} municipios, {provincia['filas']} filas")
@@ -0,0 +1,233 @@
+import argparse
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from datos import PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca, codigos_viabilidad
+from particiones import cargar_datos_provincia, cargar_indice, version_datos
+
+# Archivos con los perfiles guardados, los avisos generados y el estado de las zonas en la última evaluación
+ARCHIVO_PERFILES = 'perfiles.csv'
+ARCHIVO_NOTIFICACIONES = 'notificaciones.csv'
+ARCHIVO_ESTADO_ZONAS = 'estado_zonas.csv'
+
+# Claves que identifican la zona seguida por un perfil
+CLAVES_ZONA = ['Provincia', 'Zona', 'Tipo de vivienda']
+COLUMNAS_PERFILES = ['Id', 'Edad', 'Ingresos'] + CLAVES_ZONA + ['Viabilidad', 'Posición', 'Fecha']
+COLUMNAS_NOTIFICACIONES = ['Id', 'Fecha', 'Zona', 'Tipo de vivienda', 'Mensaje']
+
+# Textos de cada código de viabilidad en los avisos
+TEXTOS_VIABILIDAD = {0: 'sin datos', 1: 'viable', 2: 'moderadamente viable', 3: 'no viable'}
+
+
+# Función para calcular el estado de cada zona y tipo de vivienda: valor medio de compra y posición de la zona
+# entre las de su provincia (de más a menos asequible)
+def estado_zonas(df):
+    estado = df.groupby(['prov_code', 'Ciudad', 'Tipo de vivienda'])['Valor medio de compra'].mean().reset_index()
+    estado = estado.rename(columns={'prov_code': 'Provincia', 'Ciudad': 'Zona'})
+    estado['Posición'] = estado.groupby(['Provincia', 'Tipo de vivienda'])['Valor medio de compra'].rank(method='min')
+    estado['Posición'] = estado['Posición'].fillna(0).astype(int)
+    return estado.set_index(CLAVES_ZONA)
+
+
+# Función para obtener las zonas cuyo estado ha cambiado entre dos evaluaciones (o que son nuevas o han desaparecido)
+def zonas_cambiadas(nuevo, anterior):
+    if anterior is None:
+        return nuevo.index
+    comparado = nuevo.join(anterior, rsuffix=' anterior', how='outer')
+    valor, valor_anterior = comparado['Valor medio de compra'], comparado['Valor medio de compra anterior']
+    cambio_valor = ~np.isclose(valor, valor_anterior, equal_nan=True)
+    cambio_posicion = comparado['Posición'] != comparado['Posición anterior']
+    return comparado.index[cambio_valor | cambio_posicion]
+
+
+# Función para calcular la viabilidad y la posición de la zona de un perfil a partir del estado de las zonas
+def estado_perfil(estado, provincia, zona, tipo_vivienda, ingresos):
+    if (provincia, zona, tipo_vivienda) not in estado.index:
+        return 0, 0
+    fila = estado.loc[(provincia, zona, tipo_vivienda)]
+    return int(viabilidad_perfiles([fila['Valor medio de compra']], ingresos)[0]), int(fila['Posición'])
+
+
+# Función para calcular la viabilidad de unos valores de compra para los ingresos de cada perfil
+def viabilidad_perfiles(valores_compra, ingresos):
+    return codigos_viabilidad(calcular_hipoteca(np.asarray(valores_compra, dtype=float), TASA_INTERES, PLAZO_ANIOS),
+                              np.asarray(ingresos, dtype=float))
+
+
+# Almacén de perfiles guardados con un índice de zona a perfiles interesados, para que tras una actualización
+# de datos solo se revisen los perfiles que siguen alguna zona que ha cambiado. El archivo lo comparten todas las
+# réplicas y la línea de comandos, así que cada escritura se hace con un bloqueo del archivo.
+class AlmacenPerfiles:
+    def __init__(self, ruta=ARCHIVO_PERFILES, ruta_notificaciones=ARCHIVO_NOTIFICACIONES):
+        self.ruta = ruta
+        self.ruta_notificaciones = ruta_notificaciones
+        self.bloqueo = threading.Lock()
+        self.perfiles = None
+        self.indice = {}
+
+    # Función para bloquear el archivo de perfiles frente a otros procesos mientras se modifica
+    @contextmanager
+    def bloqueo_archivo(self):
+        with open(f'{self.ruta}.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Función para leer los perfiles y construir el índice de zona a perfiles
+    def cargar(self):
+        with self.bloqueo:
+            self.leer()
+
+    # Función para leer el archivo de perfiles (sin el bloqueo de hilos, que pone quien la llama)
+    def leer(self):
+        if os.path.exists(self.ruta):
+            self.perfiles = pd.read_csv(self.ruta, dtype={'Id': str, 'Provincia': str})
+        else:
+            self.perfiles = pd.DataFrame(columns=COLUMNAS_PERFILES)
+        self.indice = {clave: filas for clave, filas in self.perfiles.groupby(CLAVES_ZONA).indices.items()}
+
+    # Función para guardar un perfil con el estado actual de su zona; devuelve su identificador
+    def guardar_perfil(self, edad, ingresos, provincia, zona, tipo_vivienda, viabilidad, posicion):
+        if self.perfiles is None:
+            self.cargar()
+        with self.bloqueo, self.bloqueo_archivo():
+            identificador = os.urandom(4).hex()
+            perfil = pd.DataFrame([{
+                'Id': identificador, 'Edad': edad, 'Ingresos': ingresos, 'Provincia': provincia, 'Zona': zona,
+                'Tipo de vivienda': tipo_vivienda, 'Viabilidad': viabilidad, 'Posición': posicion,
+                'Fecha': pd.Timestamp.now().isoformat(timespec='seconds'),
+            }], columns=COLUMNAS_PERFILES)
+            perfil.to_csv(self.ruta, mode='a', header=not os.path.exists(self.ruta), index=False)
+
+            fila = len(self.perfiles)
+            self.perfiles = pd.concat([self.perfiles, perfil], ignore_index=True) if fila else perfil
+            clave = (provincia, zona, tipo_vivienda)
+            self.indice[clave] = np.append(self.indice.get(clave, np.empty(0, dtype=np.int64)), fila)
+        return identificador
+
+    # Función para obtener las filas de los perfiles que siguen alguna de las zonas indicadas
+    def perfiles_afectados(self, claves):
+        filas = [self.indice[clave] for clave in claves if clave in self.indice]
+        return np.sort(np.concatenate(filas)) if filas else np.empty(0, dtype=np.int64)
+
+    # Función para evaluar los perfiles con el estado de las zonas de una versión de los datos. Todo se hace con el
+    # bloqueo del archivo puesto: si otro proceso ya ha evaluado esa versión no se hace nada (así cada aviso se
+    # genera una sola vez aunque haya varias réplicas), y los perfiles se vuelven a leer para no perder los que
+    # hayan guardado otros procesos desde la última carga. Devuelve los avisos generados.
+    def evaluar(self, estado, version, ruta_estado=ARCHIVO_ESTADO_ZONAS):
+        with self.bloqueo, self.bloqueo_archivo():
+            anterior, version_anterior = leer_estado(ruta_estado)
+            if version_anterior == version:
+                return pd.DataFrame(columns=COLUMNAS_NOTIFICACIONES)
+            self.leer()
+            avisos = self.revisar(estado, zonas_cambiadas(estado, anterior))
+
+            temporal = f'{ruta_estado}.tmp'
+            estado.reset_index().assign(Versión=version).to_csv(temporal, index=False)
+            os.replace(temporal, ruta_estado)
+            return avisos
+
+    # Función para volver a evaluar los perfiles afectados por un cambio de estado de las zonas. Guarda el nuevo
+    # estado de los perfiles y devuelve los avisos generados (quien la llama tiene puestos los bloqueos).
+    def revisar(self, estado, claves_cambiadas):
+        filas = self.perfiles_afectados(claves_cambiadas)
+        if not filas.size:
+            return pd.DataFrame(columns=COLUMNAS_NOTIFICACIONES)
+
+        afectados = self.perfiles.iloc[filas]
+        actual = estado.reindex(pd.MultiIndex.from_frame(afectados[CLAVES_ZONA]))
+        viabilidad = viabilidad_perfiles(actual['Valor medio de compra'].to_numpy(), afectados['Ingresos'])
+        posicion = actual['Posición'].fillna(0).astype(int).to_numpy()
+        viabilidad_anterior = afectados['Viabilidad'].to_numpy()
+        posicion_anterior = afectados['Posición'].to_numpy()
+
+        # Avisos de los perfiles cuya zona ha cambiado de viabilidad o de posición (construidos en bloque)
+        cambio_viabilidad = viabilidad != viabilidad_anterior
+        cambio_posicion = (posicion != posicion_anterior) & (posicion > 0)
+        cambios = np.flatnonzero(cambio_viabilidad | cambio_posicion)
+        con_aviso = afectados.iloc[cambios]
+        zona = con_aviso['Zona'].astype(str).to_numpy()
+        textos = np.vectorize(TEXTOS_VIABILIDAD.get, otypes=[str])
+        mensaje_viabilidad = np.where(
+            cambio_viabilidad[cambios],
+            zona + ' pasa de ' + textos(viabilidad_anterior[cambios]) + ' a ' + textos(viabilidad[cambios])
+            + ' para tus ingresos',
+            ''
+        )
+        mensaje_posicion = np.where(
+            cambio_posicion[cambios],
+            zona + ' pasa del puesto ' + posicion_anterior[cambios].astype(str) + ' al '
+            + posicion[cambios].astype(str) + ' entre las zonas más asequibles de la provincia',
+            ''
+        )
+        separador = np.where((mensaje_viabilidad != '') & (mensaje_posicion != ''), '; ', '')
+        avisos = pd.DataFrame({
+            'Id': con_aviso['Id'].to_numpy(),
+            'Fecha': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'Zona': zona,
+            'Tipo de vivienda': con_aviso['Tipo de vivienda'].to_numpy(),
+            'Mensaje': mensaje_viabilidad + separador + mensaje_posicion,
+        }, columns=COLUMNAS_NOTIFICACIONES)
+
+        # Guardar el nuevo estado de los perfiles revisados (de forma atómica) y los avisos
+        self.perfiles.loc[self.perfiles.index[filas], 'Viabilidad'] = viabilidad
+        self.perfiles.loc[self.perfiles.index[filas], 'Posición'] = posicion
+        temporal = f'{self.ruta}.tmp'
+        self.perfiles.to_csv(temporal, index=False)
+        os.replace(temporal, self.ruta)
+        if not avisos.empty:
+            avisos.to_csv(self.ruta_notificaciones, mode='a', index=False,
+                          header=not os.path.exists(self.ruta_notificaciones))
+        return avisos
+
+    # Función para leer los avisos de un perfil
+    def notificaciones(self, identificador):
+        if not os.path.exists(self.ruta_notificaciones):
+            return pd.DataFrame(columns=COLUMNAS_NOTIFICACIONES)
+        avisos = pd.read_csv(self.ruta_notificaciones, dtype={'Id': str})
+        return avisos[avisos['Id'] == identificador].reset_index(drop=True)
+
+
+# Función para leer el estado de las zonas de la última evaluación (None si no hay ninguna o es de otra versión)
+def leer_estado(ruta=ARCHIVO_ESTADO_ZONAS):
+    if not os.path.exists(ruta):
+        return None, None
+    estado = pd.read_csv(ruta, dtype={'Provincia': str})
+    version = estado['Versión'].iloc[0] if not estado.empty else None
+    return estado.drop(columns='Versión').set_index(CLAVES_ZONA), version
+
+
+# Función para evaluar los perfiles guardados tras una actualización de los datos. Solo se revisan los
+# perfiles que siguen zonas cuyo valor o posición ha cambiado desde la evaluación anterior. La versión se comprueba
+# antes de cargar los datos para no calcular el estado si ya está evaluada, y de nuevo con el bloqueo puesto.
+def evaluar_actualizacion(almacen, indice=None, ruta_estado=ARCHIVO_ESTADO_ZONAS):
+    indice = indice if indice is not None else cargar_indice()
+    version = version_datos(indice)
+    _, version_anterior = leer_estado(ruta_estado)
+    if version_anterior == version:
+        return pd.DataFrame(columns=COLUMNAS_NOTIFICACIONES)
+
+    df = pd.concat([
+        cargar_datos_provincia(prov_code, version).assign(prov_code=prov_code)
+        for prov_code in indice['provincias']
+    ], ignore_index=True)
+    return almacen.evaluar(estado_zonas(df), version, ruta_estado)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evalúa los perfiles guardados tras una actualización de los datos.")
+    parser.add_argument('--perfiles', default=ARCHIVO_PERFILES, help="Archivo de perfiles guardados")
+    parser.add_argument('--notificaciones', default=ARCHIVO_NOTIFICACIONES, help="Archivo de avisos")
+    args = parser.parse_args()
+
+    almacen = AlmacenPerfiles(args.perfiles, args.notificaciones)
+    almacen.cargar()
+    avisos = evaluar_actualizacion(almacen)
+    print(f"Perfiles guardados: {len(almacen.perfiles)}, avisos generados: {len(avisos)}")
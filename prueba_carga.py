@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from datos import ARCHIVO_DATOS, ARCHIVO_GEOJSON, HISTORICAL_FILE
+
+# Prueba de carga: ejecuta muchas sesiones de la aplicación a la vez con la API de pruebas de Streamlit
+# (AppTest), siguiendo recorridos de usuario, y mide la latencia de cada re-ejecución del script.
+
+DIRECTORIO_APLICACION = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_APLICACION = os.path.join(DIRECTORIO_APLICACION, 'herramienta.py')
+
+# Valores de ingresos que eligen los usuarios simulados
+INGRESOS_SIMULADOS = [15000, 20000, 25000, 30000, 35000, 40000, 50000, 60000, 80000]
+
+
+# Función para obtener un widget a partir del principio de su etiqueta
+def buscar_widget(widgets, etiqueta):
+    return next(widget for widget in widgets if widget.label.startswith(etiqueta))
+
+
+# Pasos que puede dar un usuario simulado en la aplicación
+def paso_cambiar_ingresos(at, rng):
+    buscar_widget(at.sidebar.number_input, "¿Cuáles son tus ingresos").set_value(rng.choice(INGRESOS_SIMULADOS))
+
+
+def paso_cambiar_zona(at, rng):
+    selector = buscar_widget(at.sidebar.selectbox, "Selecciona tu zona")
+    selector.set_value(rng.choice(selector.options))
+
+
+def paso_cambiar_tipo(at, rng):
+    selector = buscar_widget(at.sidebar.selectbox, "Selecciona tu tipo de vivienda")
+    selector.set_value(rng.choice(selector.options))
+
+
+def paso_cambiar_provincia(at, rng):
+    selector = buscar_widget(at.sidebar.selectbox, "Selecciona la provincia")
+    selector.set_value(rng.choice(selector.options))
+
+
+def paso_usar_mapa(at, rng):
+    # Cambiar la capa del mapa y mostrar u ocultar los marcadores de todas las zonas
+    selector = buscar_widget(at.radio, "Capa del mapa")
+    selector.set_value(rng.choice(selector.options))
+    buscar_widget(at.checkbox, "Mostrar los centros de las zonas").set_value(rng.random() < 0.5)
+
+
+PASOS = {
+    'ingresos': paso_cambiar_ingresos,
+    'zona': paso_cambiar_zona,
+    'tipo': paso_cambiar_tipo,
+    'provincia': paso_cambiar_provincia,
+    'mapa': paso_usar_mapa,
+}
+
+# Recorridos de usuario predefinidos
+RECORRIDOS = {
+    'explorador': ['ingresos', 'zona', 'mapa', 'zona', 'tipo', 'mapa'],
+    'ajuste_ingresos': ['ingresos', 'mapa', 'ingresos', 'mapa', 'ingresos'],
+    'comparador': ['zona', 'zona', 'tipo', 'zona', 'mapa'],
+    'nacional': ['provincia', 'zona', 'ingresos', 'mapa'],
+}
+
+
+# Función para obtener la memoria residente actual del proceso en bytes
+def memoria_residente():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss es el máximo alcanzado (en KB en Linux, en bytes en macOS)
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maximo if sys.platform == 'darwin' else maximo * 1024
+
+
+# Función para calcular un percentil de una lista de valores
+def percentil(valores, p):
+    if not valores:
+        return float('nan')
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+# Función para generar un dataset sintético grande con el mismo formato que los archivos incluidos
+def generar_datos(directorio, zonas=1000, provincias=10, anios=range(2014, 2025), semilla=0):
+    rng = random.Random(semilla)
+    lado = 0.05
+    columnas_rejilla = int(zonas ** 0.5) + 1
+
+    filas = []
+    features = []
+    for i in range(zonas):
+        prov_code = f"{i * provincias // zonas + 1:02d}"
+        nombre = f"Municipio {i:05d}"
+        lon = -7.0 + (i % columnas_rejilla) * lado
+        lat = 36.5 + (i // columnas_rejilla) * lado
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': [[[lon, lat], [lon + lado, lat], [lon + lado, lat + lado], [lon, lat + lado], [lon, lat]]],
+            },
+            'properties': {
+                'prov_code': prov_code,
+                'prov_name': f"Provincia {prov_code}",
+                'mun_code': f"{prov_code}{i:05d}",
+                'mun_name': nombre,
+            },
+        })
+
+        for tipo, factor in [("Nueva", 1.15), ("Segunda mano", 1.0)]:
+            precio_m2 = rng.uniform(800, 4000) * factor
+            anterior = None
+            for anio in anios:
+                precio_m2 *= 1 + rng.uniform(-0.03, 0.08)
+                variacion = '' if anterior is None else round((precio_m2 / anterior - 1) * 100, 1)
+                anterior = precio_m2
+                filas.append(';'.join(str(valor) for valor in [
+                    nombre, anio, round(precio_m2), round(precio_m2 * rng.uniform(80, 120)), variacion,
+                    round(rng.uniform(5, 50), 1), tipo,
+                    f"{lat + lado / 2:.4f}".replace('.', ','), f"{lon + lado / 2:.4f}".replace('.', ','),
+                ]))
+
+    with open(os.path.join(directorio, ARCHIVO_DATOS), 'w', encoding='utf-8') as f:
+        f.write("Ciudad;Año;Precio medio/m²;Valor medio de compra;Variación anual (%);Proyección 5 años (%);"
+                "Tipo de vivienda;Latitud;Longitud\n")
+        f.write('\n'.join(filas) + '\n')
+    with open(os.path.join(directorio, ARCHIVO_GEOJSON), 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+# Función para preparar el directorio de trabajo de la prueba (así no se modifica el historial real)
+def preparar_directorio(datos, zonas, provincias):
+    directorio = tempfile.mkdtemp(prefix='prueba_carga_')
+    if datos == 'generados':
+        generar_datos(directorio, zonas, provincias)
+    else:
+        for archivo in [ARCHIVO_DATOS, ARCHIVO_GEOJSON]:
+            shutil.copy(os.path.join(DIRECTORIO_APLICACION, archivo), directorio)
+    ruta_historial = os.path.join(DIRECTORIO_APLICACION, HISTORICAL_FILE)
+    if os.path.exists(ruta_historial):
+        shutil.copy(ruta_historial, directorio)
+    return directorio
+
+
+# Función que ejecuta una sesión simulada y guarda sus latencias
+def ejecutar_sesion(numero, recorrido, pasos, resultados, barrera, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(numero)
+    etapa = 'preparación'
+    try:
+        try:
+            at = AppTest.from_file(SCRIPT_APLICACION, default_timeout=timeout)
+        finally:
+            # Se llega a la barrera aunque falle la preparación, para no bloquear al resto de sesiones
+            barrera.wait()
+
+        etapa = 'ejecución inicial'
+        inicio = time.perf_counter()
+        at.run()
+        resultados['iniciales'].append(time.perf_counter() - inicio)
+        if at.exception:
+            resultados['errores'].append(f"sesión {numero}, {etapa}: {at.exception[0].message}")
+
+        for i in range(pasos):
+            paso = RECORRIDOS[recorrido][i % len(RECORRIDOS[recorrido])]
+            etapa = f"paso '{paso}'"
+            PASOS[paso](at, rng)
+            inicio = time.perf_counter()
+            at.run()
+            resultados['reejecuciones'].append(time.perf_counter() - inicio)
+            if at.exception:
+                resultados['errores'].append(f"sesión {numero}, {etapa}: {at.exception[0].message}")
+    except Exception as e:
+        # Tiempo agotado, widget que no existe, barrera rota...: el fallo cuenta como error de la sesión
+        resultados['errores'].append(f"sesión {numero}, {etapa}: {type(e).__name__}: {e}")
+
+
+# Función para lanzar las sesiones concurrentes y calcular las métricas
+def ejecutar_prueba(sesiones=10, pasos=10, recorridos=None, datos='incluidos', zonas=1000, provincias=10, timeout=300):
+    recorridos = recorridos or list(RECORRIDOS)
+    directorio_original = os.getcwd()
+    directorio = preparar_directorio(datos, zonas, provincias)
+    os.chdir(directorio)
+    sys.path.insert(0, DIRECTORIO_APLICACION)
+
+    resultados = {'iniciales': [], 'reejecuciones': [], 'errores': []}
+    barrera = threading.Barrier(sesiones + 1, timeout=timeout)
+    try:
+        memoria_inicial = memoria_residente()
+        hilos = [
+            threading.Thread(
+                target=ejecutar_sesion,
+                args=(numero, recorridos[numero % len(recorridos)], pasos, resultados, barrera, timeout),
+                daemon=True,
+            )
+            for numero in range(sesiones)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        try:
+            barrera.wait()
+        except threading.BrokenBarrierError:
+            # Alguna sesión no ha llegado a tiempo; cada una registra su propio error
+            pass
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+        memoria_final = memoria_residente()
+    finally:
+        os.chdir(directorio_original)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    reejecuciones = resultados['reejecuciones']
+    return {
+        'datos': datos,
+        'sesiones': sesiones,
+        'pasos_por_sesion': pasos,
+        'duracion_s': duracion,
+        'reejecuciones': len(reejecuciones),
+        'rendimiento_reejecuciones_s': len(reejecuciones) / duracion if duracion else 0.0,
+        'latencia_inicial_p50_ms': percentil(resultados['iniciales'], 50) * 1000,
+        'latencia_p50_ms': percentil(reejecuciones, 50) * 1000,
+        'latencia_p95_ms': percentil(reejecuciones, 95) * 1000,
+        'latencia_p99_ms': percentil(reejecuciones, 99) * 1000,
+        'memoria_por_sesion_mb': (memoria_final - memoria_inicial) / sesiones / 2 ** 20,
+        'errores': resultados['errores'],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes de la aplicación.")
+    parser.add_argument('--sesiones', type=int, default=10, help="Número de sesiones simultáneas")
+    parser.add_argument('--pasos', type=int, default=10, help="Re-ejecuciones por sesión")
+    parser.add_argument('--recorridos', nargs='+', choices=list(RECORRIDOS), help="Recorridos de usuario a simular")
+    parser.add_argument('--datos', choices=['incluidos', 'generados'], default='incluidos',
+                        help="Usar los datos incluidos en el repositorio o un dataset sintético grande")
+    parser.add_argument('--zonas', type=int, default=1000, help="Municipios del dataset generado")
+    parser.add_argument('--provincias', type=int, default=10, help="Provincias del dataset generado")
+    parser.add_argument('--json', help="Guardar el resultado en este archivo JSON")
+    args = parser.parse_args()
+
+    resultado = ejecutar_prueba(args.sesiones, args.pasos, args.recorridos, args.datos, args.zonas, args.provincias)
+    for clave, valor in resultado.items():
+        if clave != 'errores':
+            print(f"{clave}: {valor:.2f}" if isinstance(valor, float) else f"{clave}: {valor}")
+    print(f"errores: {len(resultado['errores'])}")
+    for error in resultado['errores'][:10]:
+        print(f"  - {error}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
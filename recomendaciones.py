@@ -0,0 +1,81 @@
+import numpy as np
+
+from datos import PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca
+
+# Pesos por defecto de cada criterio en la puntuación total
+PESOS_RECOMENDACION = {'viabilidad': 0.4, 'proyeccion': 0.3, 'accesibilidad': 0.3}
+
+# Columnas precalculadas para cada zona
+COLUMNAS_PUNTUACIONES = ['Puntuación proyección', 'Puntuación accesibilidad', 'Hipoteca mensual', 'Pareto']
+
+
+# Función para obtener el frente de Pareto (skyline) de una matriz de costes (filas x criterios, menor es mejor).
+# Se recorren los puntos ordenados por la suma de sus costes (ningún punto puede estar dominado por otro que
+# vaya después), y cada uno solo se compara con el frente encontrado hasta ese momento.
+def frente_pareto(costes):
+    costes = np.asarray(costes, dtype=float)
+    orden = np.lexsort(costes.T[::-1])
+    orden = orden[np.argsort(costes[orden].sum(axis=1), kind='stable')]
+    frente = []
+    for fila in orden:
+        if frente:
+            candidatos = costes[frente]
+            dominada = ((candidatos <= costes[fila]).all(axis=1) & (candidatos < costes[fila]).any(axis=1)).any()
+            if dominada:
+                continue
+        frente.append(fila)
+    en_frente = np.zeros(len(costes), dtype=bool)
+    en_frente[frente] = True
+    return en_frente
+
+
+# Función para precalcular los indicadores y puntuaciones normalizadas de cada zona para un tipo de vivienda.
+# No dependen de los ingresos, así que se calculan una sola vez y se reutilizan al cambiar ingresos o pesos.
+def puntuaciones_zonas(df, tipo_vivienda):
+    # Calcular el promedio de precio medio/m² para usar como referencia
+    promedio_precio_m2 = df['Precio medio/m²'].mean()
+
+    zonas = df[df['Tipo de vivienda'] == tipo_vivienda].groupby(['Ciudad', 'Tipo de vivienda'])[
+        ['Precio medio/m²', 'Valor medio de compra', 'Proyección 5 años (%)']
+    ].mean().reset_index()
+    zonas = zonas.dropna()
+    zonas = zonas[zonas['Valor medio de compra'] > 0].reset_index(drop=True)  # Ignorar valores no válidos
+    if zonas.empty:
+        return zonas.reindex(columns=list(zonas.columns) + COLUMNAS_PUNTUACIONES)
+
+    # Puntuaciones entre 0 y 1 (mayor es mejor): la proyección se escala entre la peor y la mejor zona y la
+    # accesibilidad según la distancia al precio medio/m² de referencia, relativa a la zona más alejada
+    proyeccion = zonas['Proyección 5 años (%)'].to_numpy()
+    rango_proyeccion = proyeccion.max() - proyeccion.min()
+    zonas['Puntuación proyección'] = ((proyeccion - proyeccion.min()) / rango_proyeccion
+                                      if rango_proyeccion > 0 else np.ones(len(zonas)))
+    distancia = (zonas['Precio medio/m²'] - promedio_precio_m2).abs().to_numpy()
+    zonas['Puntuación accesibilidad'] = 1 - distancia / distancia.max() if distancia.max() > 0 else 1.0
+
+    zonas['Hipoteca mensual'] = calcular_hipoteca(zonas['Valor medio de compra'].to_numpy(), TASA_INTERES, PLAZO_ANIOS)
+
+    # El porcentaje de ingresos es proporcional a la hipoteca, así que el frente no depende de los ingresos
+    zonas['Pareto'] = frente_pareto(np.column_stack([zonas['Hipoteca mensual'], -proyeccion, distancia]))
+    return zonas
+
+
+# Función para ordenar las zonas precalculadas según los ingresos y los pesos de cada criterio
+def ordenar_recomendaciones(zonas, ingresos, pesos=None, solo_pareto=False):
+    if zonas.empty:
+        return zonas
+    pesos = pesos or PESOS_RECOMENDACION
+    recomendaciones_df = zonas[zonas['Pareto'].astype(bool)] if solo_pareto else zonas
+
+    recomendaciones_df = recomendaciones_df.copy()
+    recomendaciones_df['Porcentaje de ingresos'] = recomendaciones_df['Hipoteca mensual'] * 12 / ingresos * 100
+    # Menor porcentaje es mejor: 1 si la hipoteca no cuesta nada y 0 a partir del 100% de los ingresos
+    recomendaciones_df['Puntuación viabilidad'] = (1 - recomendaciones_df['Porcentaje de ingresos'] / 100).clip(0, 1)
+
+    total_pesos = sum(pesos.values()) or 1
+    recomendaciones_df['Puntuación total'] = 100 * (
+        pesos['viabilidad'] * recomendaciones_df['Puntuación viabilidad'] +
+        pesos['proyeccion'] * recomendaciones_df['Puntuación proyección'] +
+        pesos['accesibilidad'] * recomendaciones_df['Puntuación accesibilidad']
+    ) / total_pesos
+    return recomendaciones_df.sort_values(by='Puntuación total', ascending=False)
+
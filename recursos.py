@@ -0,0 +1,352 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from agrupacion_zonas import centroides_zonas, puntos_zonas
+from cache_compartida import CacheCompartida, cache_resultados, clave_cache
+from cuantiles import cuantiles_dataset, resumen_distribucion
+from datos import HISTORICAL_FILE
+from evolucion_viabilidad import hipotecas_anuales, viabilidad_anual
+from graficos import (calcular_tendencia_precios, figura_comparativo, figura_distribucion_precios,
+                      figura_evolucion_viabilidad, figura_tendencia_precios)
+from indice_ingresos import IndiceIngresos
+from mapa import (COLORES_VIABILIDAD, TEXTOS_VIABILIDAD, capa_segmentos, geometrias_geojson, geometrias_validas,
+                  precios_zonas, segmentos_zonas, viabilidad_zonas, zonas_mapa)
+from memoria_compartida import (USAR_MEMORIA_COMPARTIDA, cargar_datos_memoria, cargar_geometrias_mapa_memoria,
+                                cargar_hipotecas_anuales_memoria, cargar_precios_zonas_memoria, cargar_zonas_memoria,
+                                preparar_memoria, ruta_geometrias_mapa_memoria)
+from perfiles import AlmacenPerfiles, estado_zonas
+from particiones import (cargar_cuantiles_provincia, cargar_datos_provincia, cargar_geometrias_provincia, cargar_indice,
+                         version_datos)
+from recomendaciones import PESOS_RECOMENDACION, ordenar_recomendaciones, puntuaciones_zonas
+from segmentos import COLORES_SEGMENTOS, cargar_segmentos
+from simulacion_tipos import TASA_LARGO_PLAZO, VOLATILIDAD, riesgo_por_zona
+from sparklines import detalles_zonas
+from zonas_similares import buscar_similares, construir_indice_similitud
+
+# Recursos compartidos por todas las sesiones del proceso. Tanto la aplicación como el precalentamiento
+# de arranque los obtienen a través de estas funciones, de modo que usan las mismas claves de caché.
+
+# Recursos que se guardan por provincia en cache_recursos: datos, geometrías, atributos de las zonas del mapa,
+# GeoJSON del mapa, detalles, precios, cuantiles, hipotecas anuales, puntuaciones de cada tipo de vivienda, índice
+# de similitud y estado de las zonas
+RECURSOS_POR_PROVINCIA = 12
+
+# Número de provincias cuyos recursos se mantienen a la vez en memoria
+PROVINCIAS_EN_MEMORIA = int(os.environ.get('TFM_PROVINCIAS_EN_MEMORIA', 3))
+
+# Caché de los recursos que no dependen de la provincia (índice, segmentos y marcadores de todas las zonas), para
+# que la carga de provincias no los expulse
+cache_global = CacheCompartida(capacidad=16)
+
+# Caché de los datos cargados por provincia (solo se mantienen en memoria las provincias consultadas recientemente)
+cache_recursos = CacheCompartida(capacidad=PROVINCIAS_EN_MEMORIA * RECURSOS_POR_PROVINCIA)
+
+# Índice ordenado de ingresos del historial
+indice_ingresos = IndiceIngresos(HISTORICAL_FILE)
+
+# Perfiles guardados por los usuarios para recibir avisos cuando cambian los datos
+almacen_perfiles = AlmacenPerfiles()
+
+# Hilos para cargar en paralelo los recursos de una provincia (la lectura de CSV y GeoJSON libera el GIL)
+pool_carga = ThreadPoolExecutor(max_workers=4, thread_name_prefix='carga')
+
+
+# Cargar el índice de provincias (las particiones se generan la primera vez a partir de los archivos de origen)
+def obtener_indice():
+    return cache_global.obtener(('indice',), cargar_indice)
+
+
+# Versión de los datos, usada en las claves de la caché compartida entre sesiones
+def obtener_version():
+    return version_datos(obtener_indice())
+
+
+# Directorio con los archivos mapeados en memoria de la versión actual de los datos (se generan una sola vez y
+# los comparten todas las réplicas del equipo)
+def obtener_memoria():
+    return cache_global.obtener(
+        clave_cache('memoria', obtener_version()),
+        lambda: preparar_memoria(obtener_indice())
+    )
+
+
+# Cargar los datos de una provincia
+def obtener_datos_provincia(prov_code):
+    def cargar_datos():
+        if USAR_MEMORIA_COMPARTIDA:
+            return cargar_datos_memoria(obtener_memoria(), prov_code)
+        return cargar_datos_provincia(prov_code, obtener_version())
+
+    return cache_recursos.obtener(
+        clave_cache('datos', obtener_version(), provincia=prov_code),
+        cargar_datos
+    )
+
+
+# Cargar las geometrías de una provincia, descartando una sola vez las que no son válidas (solo hacen falta para
+# generar el GeoJSON del mapa)
+def obtener_geometrias_provincia(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('geometrias', obtener_version(), provincia=prov_code),
+        lambda: geometrias_validas(cargar_geometrias_provincia(prov_code, obtener_version()))
+    )
+
+
+# Atributos de las zonas del mapa de una provincia, sin geometrías. Con la memoria compartida se leen de los archivos
+# mapeados sin cargar ninguna geometría.
+def obtener_zonas_mapa(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('zonas_mapa', obtener_version(), provincia=prov_code),
+        lambda: (cargar_zonas_memoria(obtener_memoria(), prov_code) if USAR_MEMORIA_COMPARTIDA
+                 else zonas_mapa(obtener_geometrias_provincia(prov_code)))
+    )
+
+
+# Gráfico comparativo de la evolución del precio en todas las zonas de la provincia
+def obtener_figura_comparativo(prov_code, tipo_vivienda):
+    def calcular_comparativo():
+        df = obtener_datos_provincia(prov_code)
+        filtro_tipo_vivienda = df[df['Tipo de vivienda'] == tipo_vivienda]
+        tendencia_todas_zonas = filtro_tipo_vivienda.groupby(['Año', 'Ciudad']).agg({'Precio medio/m²': 'mean'}).reset_index()
+        return figura_comparativo(tendencia_todas_zonas)
+
+    return cache_resultados.obtener(
+        clave_cache('comparativo', obtener_version(), provincia=prov_code, tipo_vivienda=tipo_vivienda),
+        calcular_comparativo
+    )
+
+
+# Gráfico de la tendencia de precios de una zona
+def obtener_figura_tendencia(prov_code, zona):
+    def calcular_tendencia():
+        df = obtener_datos_provincia(prov_code)
+        return figura_tendencia_precios(calcular_tendencia_precios(df[df['Ciudad'] == zona]), zona)
+
+    return cache_resultados.obtener(
+        clave_cache('tendencia', obtener_version(), provincia=prov_code, zona=zona),
+        calcular_tendencia
+    )
+
+
+# Resúmenes de cuantiles del precio por m² de cada zona, tipo de vivienda y año de una provincia
+def obtener_cuantiles(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('cuantiles', obtener_version(), provincia=prov_code),
+        lambda: cuantiles_dataset(obtener_datos_provincia(prov_code),
+                                  cargar_cuantiles_provincia(prov_code, obtener_version()))
+    )
+
+
+# Resumen de la distribución de precios de una zona por tipo de vivienda (cuartiles y percentiles)
+def obtener_resumen_distribucion(prov_code, zona):
+    def calcular_resumen():
+        cuantiles = obtener_cuantiles(prov_code)
+        return resumen_distribucion(cuantiles[cuantiles['Ciudad'] == zona])
+
+    return cache_resultados.obtener(
+        clave_cache('resumen_distribucion', obtener_version(), provincia=prov_code, zona=zona),
+        calcular_resumen
+    )
+
+
+# Gráfico de la distribución de precios de una zona
+def obtener_figura_distribucion(prov_code, zona):
+    return cache_resultados.obtener(
+        clave_cache('distribucion', obtener_version(), provincia=prov_code, zona=zona),
+        lambda: figura_distribucion_precios(obtener_resumen_distribucion(prov_code, zona))
+    )
+
+
+# Mini-gráficas de tendencia e indicadores de cada zona para los tooltips del mapa
+def obtener_detalles_zonas(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('detalles_zonas', obtener_version(), provincia=prov_code),
+        lambda: detalles_zonas(obtener_datos_provincia(prov_code))
+    )
+
+
+# GeoJSON de las zonas de una provincia tal y como se envía al navegador. Con la memoria compartida se lee del
+# archivo mapeado cada vez que se envía, en lugar de guardar una copia en la memoria de cada proceso.
+def obtener_geometrias_mapa(prov_code):
+    if USAR_MEMORIA_COMPARTIDA:
+        return cargar_geometrias_mapa_memoria(obtener_memoria(), prov_code)
+    return cache_recursos.obtener(
+        clave_cache('geometrias_mapa', obtener_version(), provincia=prov_code),
+        lambda: geometrias_geojson(obtener_geometrias_provincia(prov_code), obtener_detalles_zonas(prov_code))
+    )
+
+
+# Preparar el GeoJSON de una provincia en cada ejecución del script. Con la memoria compartida solo se comprueba
+# que el archivo existe: el mapa lo lee una sola vez, cuando tiene que enviar las geometrías al navegador.
+def preparar_geometrias_mapa(prov_code):
+    if USAR_MEMORIA_COMPARTIDA:
+        return os.path.getsize(ruta_geometrias_mapa_memoria(obtener_memoria(), prov_code))
+    return obtener_geometrias_mapa(prov_code)
+
+
+# Valor medio de compra de cada zona, en el orden de las geometrías del mapa
+def obtener_precios_zonas(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('precios_zonas', obtener_version(), provincia=prov_code),
+        lambda: (cargar_precios_zonas_memoria(obtener_memoria(), prov_code) if USAR_MEMORIA_COMPARTIDA
+                 else precios_zonas(obtener_zonas_mapa(prov_code), obtener_datos_provincia(prov_code)))
+    )
+
+
+# Código de viabilidad de cada zona del mapa para unos ingresos dados
+def obtener_viabilidad_mapa(prov_code, ingresos):
+    return cache_resultados.obtener(
+        clave_cache('viabilidad_mapa', obtener_version(), provincia=prov_code, ingresos=ingresos),
+        lambda: viabilidad_zonas(obtener_precios_zonas(prov_code), ingresos)
+    )
+
+
+# Centro y valor medio de compra de las zonas de todas las provincias
+def obtener_centroides_zonas():
+    def calcular_centroides():
+        return centroides_zonas(pd.concat([
+            obtener_datos_provincia(prov_code).assign(prov_code=prov_code)
+            for prov_code in obtener_indice()['provincias']
+        ], ignore_index=True))
+
+    return cache_global.obtener(
+        clave_cache('centroides_zonas', obtener_version()),
+        calcular_centroides
+    )
+
+
+# Grupos de zonas por nivel de zoom para los marcadores del mapa (se calculan una sola vez por versión)
+def obtener_puntos_zonas():
+    return cache_global.obtener(
+        clave_cache('puntos_zonas', obtener_version()),
+        lambda: puntos_zonas(obtener_centroides_zonas())
+    )
+
+
+# Código de viabilidad de cada zona de los marcadores para unos ingresos dados
+def obtener_viabilidad_puntos(ingresos):
+    return cache_resultados.obtener(
+        clave_cache('viabilidad_puntos', obtener_version(), ingresos=ingresos),
+        lambda: viabilidad_zonas(obtener_centroides_zonas()['Valor medio de compra'].to_numpy(dtype=float), ingresos)
+    )
+
+
+# Hipoteca mensual de cada tipo de vivienda, zona y año de una provincia (no depende de los ingresos)
+def obtener_hipotecas_anuales(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('hipotecas_anuales', obtener_version(), provincia=prov_code),
+        lambda: (cargar_hipotecas_anuales_memoria(obtener_memoria(), prov_code) if USAR_MEMORIA_COMPARTIDA
+                 else hipotecas_anuales(obtener_datos_provincia(prov_code)))
+    )
+
+
+# Mapa de calor con la viabilidad de todas las zonas y años de un tipo de vivienda para unos ingresos
+def obtener_figura_evolucion_viabilidad(prov_code, tipo_vivienda, ingresos):
+    def calcular_figura():
+        hipotecas = obtener_hipotecas_anuales(prov_code)
+        codigos, porcentajes = viabilidad_anual(hipotecas, tipo_vivienda, ingresos)
+        return figura_evolucion_viabilidad(hipotecas['zonas'], hipotecas['anios'], codigos, porcentajes,
+                                           COLORES_VIABILIDAD, TEXTOS_VIABILIDAD)
+
+    return cache_resultados.obtener(
+        clave_cache('evolucion_viabilidad', obtener_version(), provincia=prov_code, tipo_vivienda=tipo_vivienda,
+                    ingresos=ingresos),
+        calcular_figura
+    )
+
+
+# Segmentos de mercado de todas las zonas (calculados una sola vez por versión de los datos)
+def obtener_segmentos():
+    return cache_global.obtener(
+        clave_cache('segmentos', obtener_version()),
+        lambda: cargar_segmentos(obtener_indice())
+    )
+
+
+# Segmentos de mercado de las zonas de una provincia
+def obtener_segmentos_provincia(prov_code):
+    segmentos = obtener_segmentos()
+    return segmentos[segmentos['prov_code'] == prov_code].reset_index(drop=True)
+
+
+# Capa del mapa con el segmento de mercado de cada zona de una provincia
+def obtener_capa_segmentos(prov_code):
+    def calcular_capa():
+        segmentos = obtener_segmentos()
+        nombres = segmentos.drop_duplicates('Segmento').set_index('Segmento')['Nombre segmento'].sort_index()
+        colores = {codigo: COLORES_SEGMENTOS[codigo % len(COLORES_SEGMENTOS)] for codigo in nombres.index}
+        codigos = segmentos_zonas(obtener_zonas_mapa(prov_code), obtener_segmentos_provincia(prov_code))
+        return capa_segmentos(codigos, nombres.to_dict(), colores)
+
+    return cache_resultados.obtener(
+        clave_cache('capa_segmentos', obtener_version(), provincia=prov_code),
+        calcular_capa
+    )
+
+
+# Indicadores y puntuaciones normalizadas de cada zona para un tipo de vivienda (no dependen de los ingresos)
+def obtener_puntuaciones_zonas(prov_code, tipo_vivienda):
+    return cache_recursos.obtener(
+        clave_cache('puntuaciones_zonas', obtener_version(), provincia=prov_code, tipo_vivienda=tipo_vivienda),
+        lambda: puntuaciones_zonas(obtener_datos_provincia(prov_code), tipo_vivienda)
+    )
+
+
+# Recomendaciones personalizadas para un tipo de vivienda, unos ingresos y unos pesos dados
+def obtener_recomendaciones(prov_code, tipo_vivienda, ingresos, pesos=None, solo_pareto=False):
+    pesos = pesos or PESOS_RECOMENDACION
+    return cache_resultados.obtener(
+        clave_cache('recomendaciones', obtener_version(), provincia=prov_code, tipo_vivienda=tipo_vivienda,
+                    ingresos=ingresos, solo_pareto=solo_pareto,
+                    **{f'peso_{criterio}': peso for criterio, peso in pesos.items()}),
+        lambda: ordenar_recomendaciones(obtener_puntuaciones_zonas(prov_code, tipo_vivienda), ingresos, pesos,
+                                        solo_pareto)
+    )
+
+
+# Riesgo por zona de que la hipoteca supere el 30% y el 50% de los ingresos con tipos de interés variables
+def obtener_riesgo_tipos(prov_code, ingresos, tasa_largo_plazo=TASA_LARGO_PLAZO, volatilidad=VOLATILIDAD):
+    return cache_resultados.obtener(
+        clave_cache('riesgo_tipos', obtener_version(), provincia=prov_code, ingresos=ingresos,
+                    tasa_largo_plazo=tasa_largo_plazo, volatilidad=volatilidad),
+        lambda: riesgo_por_zona(obtener_datos_provincia(prov_code), ingresos,
+                                tasa_largo_plazo=tasa_largo_plazo, volatilidad=volatilidad)
+    )
+
+
+# Índice de similitud entre zonas (características normalizadas por zona y tipo de vivienda)
+def obtener_indice_similitud(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('indice_similitud', obtener_version(), provincia=prov_code),
+        lambda: construir_indice_similitud(obtener_datos_provincia(prov_code))
+    )
+
+
+# Zonas parecidas a la preferida que sí son viables para unos ingresos dados
+def obtener_zonas_similares(prov_code, zona, tipo_vivienda, ingresos):
+    return cache_resultados.obtener(
+        clave_cache('zonas_similares', obtener_version(), provincia=prov_code, zona=zona,
+                    tipo_vivienda=tipo_vivienda, ingresos=ingresos),
+        lambda: buscar_similares(obtener_indice_similitud(prov_code), zona, tipo_vivienda, ingresos)
+    )
+
+
+# Valor medio de compra y posición de cada zona y tipo de vivienda de una provincia (estado seguido por los perfiles)
+def obtener_estado_zonas(prov_code):
+    return cache_recursos.obtener(
+        clave_cache('estado_zonas', obtener_version(), provincia=prov_code),
+        lambda: estado_zonas(obtener_datos_provincia(prov_code).assign(prov_code=prov_code))
+    )
+
+
+# Lanzar en paralelo la carga de los datos, las geometrías y el historial de una provincia. Las cargas son
+# independientes y la caché compartida evita duplicarlas, así que la aplicación puede esperar solo a lo que
+# necesita en cada momento (los datos tabulares primero y las geometrías al dibujar el mapa).
+def precargar_provincia(prov_code):
+    return {
+        'datos': pool_carga.submit(obtener_datos_provincia, prov_code),
+        'geometrias': pool_carga.submit(preparar_geometrias_mapa, prov_code),
+        'historial': pool_carga.submit(indice_ingresos.actualizar),
+    }
@@ -0,0 +1,170 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from particiones import DIRECTORIO_PARTICIONES, cargar_datos_provincia, cargar_indice, directorio_version, version_datos
+
+# Número de segmentos de mercado y parámetros del k-means
+NUM_SEGMENTOS = 4
+REPETICIONES = 10
+ITERACIONES_MAXIMAS = 100
+SEMILLA = 2024
+
+# Variables cuya evolución por año define el segmento de cada zona
+VARIABLES_SEGMENTACION = ['Precio medio/m²', 'Variación anual (%)', 'Proyección 5 años (%)']
+
+# Variables con las que se nombra cada segmento, variación anual media (%) a partir de la cual un segmento se
+# considera en crecimiento y calificativos para distinguir segmentos con el mismo nombre
+VARIABLES_NOMBRE = ['Precio medio/m²', 'Variación anual (%)']
+UMBRAL_CRECIMIENTO = 1.0
+CALIFICATIVOS_DESEMPATE = {
+    'Precio medio/m²': ['más asequible', 'de precio intermedio', 'más caro'],
+    'Variación anual (%)': ['de menor crecimiento', 'de crecimiento intermedio', 'de mayor crecimiento'],
+}
+
+# Colores de los segmentos en el mapa
+COLORES_SEGMENTOS = ['#3D5A80', '#EE6C4D', '#98C1D9', '#E0A458', '#6A994E', '#9B5DE5']
+
+
+# Función para obtener la ruta del archivo de segmentos de una versión de los datos. Se guarda con las
+# particiones de la versión, así que se borra con ellas cuando ninguna réplica las usa (limpiar_versiones).
+def ruta_segmentos(version, directorio=DIRECTORIO_PARTICIONES):
+    return os.path.join(directorio_version(version, directorio), 'segmentos.csv')
+
+
+# Función para construir la matriz de trayectorias (zonas x años de cada variable). Cada variable se tipifica
+# con una única media y desviación, de modo que se conservan tanto el nivel como la forma de la evolución.
+def matriz_trayectorias(df):
+    series = df.pivot_table(index=['prov_code', 'Ciudad'], columns='Año', values=VARIABLES_SEGMENTACION,
+                            aggfunc='mean').sort_index(axis=1)
+    bloques = []
+    for variable in VARIABLES_SEGMENTACION:
+        valores = series[variable].to_numpy(dtype=float)
+        desviacion = np.nanstd(valores)
+        bloques.append((valores - np.nanmean(valores)) / (desviacion if desviacion > 0 else 1.0))
+    # Los años sin datos quedan en la media
+    return series.index, np.nan_to_num(np.hstack(bloques))
+
+
+# Función para agrupar las filas de una matriz en k grupos (k-means con inicialización k-means++)
+def kmeans(matriz, k, repeticiones=REPETICIONES, iteraciones=ITERACIONES_MAXIMAS, semilla=SEMILLA):
+    rng = np.random.default_rng(semilla)
+    k = min(k, len(matriz))
+    mejor = None
+    for _ in range(repeticiones):
+        # Inicialización k-means++: cada centroide se elige con probabilidad proporcional a la distancia al más cercano
+        centroides = [matriz[rng.integers(len(matriz))]]
+        for _ in range(1, k):
+            distancias = ((matriz[:, None, :] - np.array(centroides)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+            total = distancias.sum()
+            indice = rng.choice(len(matriz), p=distancias / total) if total > 0 else rng.integers(len(matriz))
+            centroides.append(matriz[indice])
+        centroides = np.array(centroides)
+
+        for _ in range(iteraciones):
+            distancias = ((matriz[:, None, :] - centroides[None, :, :]) ** 2).sum(axis=2)
+            etiquetas = distancias.argmin(axis=1)
+            cuentas = np.bincount(etiquetas, minlength=k)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, etiquetas, matriz)
+            # Los grupos que se quedan vacíos conservan su centroide
+            nuevos = np.where(cuentas[:, None] > 0, sumas / np.maximum(cuentas, 1)[:, None], centroides)
+            if np.allclose(nuevos, centroides):
+                break
+            centroides = nuevos
+
+        inercia = distancias[np.arange(len(matriz)), etiquetas].sum()
+        if mejor is None or inercia < mejor[2]:
+            mejor = (etiquetas, centroides, inercia)
+    return mejor
+
+
+# Función para dar nombre a cada segmento según el precio y el crecimiento medios de sus zonas: el precio se
+# compara con los terciles de todas las zonas y el crecimiento con umbrales fijos de variación anual. Si varios
+# segmentos reciben el mismo nombre, se distinguen por la variable en la que más se diferencian.
+def nombrar_segmentos(resumen):
+    tercil_bajo, tercil_alto = resumen['Precio medio/m²'].quantile([1 / 3, 2 / 3])
+    por_segmento = resumen.groupby('Segmento')[VARIABLES_NOMBRE].mean()
+
+    nombres = {}
+    for segmento, fila in por_segmento.iterrows():
+        if fila['Precio medio/m²'] > tercil_alto:
+            precio = 'Caro'
+        elif fila['Precio medio/m²'] < tercil_bajo:
+            precio = 'Asequible'
+        else:
+            precio = 'Precio medio'
+        if fila['Variación anual (%)'] < 0:
+            crecimiento = 'a la baja'
+        elif fila['Variación anual (%)'] < UMBRAL_CRECIMIENTO:
+            crecimiento = 'estancado'
+        else:
+            crecimiento = 'en crecimiento'
+        nombres[segmento] = f'{precio} y {crecimiento}'
+
+    # Desempate: cada variable se mide en desviaciones típicas de todas las zonas
+    dispersion = resumen[VARIABLES_NOMBRE].std().replace(0, 1)
+    for nombre, empatados in pd.Series(nombres).groupby(lambda segmento: nombres[segmento]):
+        if len(empatados) < 2:
+            continue
+        valores = por_segmento.loc[empatados.index]
+        variable = ((valores.max() - valores.min()) / dispersion).idxmax()
+        orden = valores[variable].sort_values().index
+        for segmento, calificativo in zip(orden, calificativos(variable, len(orden))):
+            nombres[segmento] = f'{nombre} ({calificativo})'
+    return nombres
+
+
+# Función para obtener los calificativos que distinguen n segmentos empatados, de menor a mayor valor de la variable
+def calificativos(variable, n):
+    menor, intermedio, mayor = CALIFICATIVOS_DESEMPATE[variable]
+    if n == 2:
+        return [menor, mayor]
+    if n == 3:
+        return [menor, intermedio, mayor]
+    return [menor] + [f'{intermedio} {posicion}' for posicion in range(1, n - 1)] + [mayor]
+
+
+# Función para segmentar todas las zonas del dataset a partir de sus trayectorias anuales
+def calcular_segmentos(df, num_segmentos=NUM_SEGMENTOS):
+    zonas, matriz = matriz_trayectorias(df)
+    etiquetas, _, _ = kmeans(matriz, num_segmentos)
+
+    resumen = df.groupby(['prov_code', 'Ciudad'])[VARIABLES_NOMBRE].mean().loc[zonas]
+    resumen = resumen.reset_index()
+    # Los segmentos se numeran de más caro a más barato para que los colores sean estables entre versiones
+    resumen['Segmento'] = etiquetas
+    orden = resumen.groupby('Segmento')['Precio medio/m²'].mean().sort_values(ascending=False).index
+    resumen['Segmento'] = resumen['Segmento'].map({segmento: posicion for posicion, segmento in enumerate(orden)})
+    resumen['Nombre segmento'] = resumen['Segmento'].map(nombrar_segmentos(resumen))
+    return resumen[['prov_code', 'Ciudad', 'Segmento', 'Nombre segmento']]
+
+
+# Función para cargar los segmentos de la versión actual de los datos, calculándolos una sola vez por versión
+def cargar_segmentos(indice, directorio=DIRECTORIO_PARTICIONES):
+    ruta = ruta_segmentos(version_datos(indice), directorio)
+    if os.path.exists(ruta):
+        return pd.read_csv(ruta, sep=';', dtype={'prov_code': str})
+
+    df = pd.concat([
+        cargar_datos_provincia(prov_code, version_datos(indice), directorio).assign(prov_code=prov_code)
+        for prov_code in indice['provincias']
+    ], ignore_index=True)
+    segmentos = calcular_segmentos(df)
+
+    # Guardar de forma atómica (varias réplicas pueden calcularlos a la vez)
+    temporal = f'{ruta}.tmp-{os.getpid()}'
+    segmentos.to_csv(temporal, sep=';', index=False)
+    os.replace(temporal, ruta)
+    return segmentos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calcula los segmentos de mercado de las zonas.")
+    parser.add_argument('--directorio', default=DIRECTORIO_PARTICIONES, help="Directorio de las particiones")
+    args = parser.parse_args()
+
+    segmentos = cargar_segmentos(cargar_indice(directorio=args.directorio), args.directorio)
+    print(segmentos.groupby('Nombre segmento').size().to_string())
@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from datos import PLAZO_ANIOS, TASA_INTERES, UMBRAL_MODERADO, UMBRAL_VIABLE
+
+# Parámetros por defecto de la simulación de tipos de interés variables (modelo de Vasicek con revisión anual)
+NUM_TRAYECTORIAS = 5000
+TASA_LARGO_PLAZO = 3.5  # Tipo al que tiende el interés a largo plazo (%)
+VELOCIDAD_REVERSION = 0.2  # Fracción de la distancia al tipo de largo plazo que se corrige cada año
+VOLATILIDAD = 0.8  # Desviación típica del cambio anual del tipo (puntos porcentuales)
+SEMILLA = 2024
+
+# Trayectorias por bloque y tamaño (zonas x ingresos x trayectorias) a partir del cual se reparten entre procesos
+TAMANO_BLOQUE = 1000
+ELEMENTOS_PARALELO = 50_000_000
+
+
+# Función para generar trayectorias de tipos de interés anuales (trayectorias x años, en %)
+def generar_trayectorias(num_trayectorias, plazo_anos=PLAZO_ANIOS, tasa_inicial=TASA_INTERES,
+                         tasa_largo_plazo=TASA_LARGO_PLAZO, velocidad=VELOCIDAD_REVERSION,
+                         volatilidad=VOLATILIDAD, semilla=SEMILLA):
+    rng = np.random.default_rng(semilla)
+    choques = rng.normal(0.0, volatilidad, size=(num_trayectorias, plazo_anos - 1))
+    tasas = np.empty((num_trayectorias, plazo_anos))
+    tasas[:, 0] = tasa_inicial
+    for anio in range(1, plazo_anos):
+        anterior = tasas[:, anio - 1]
+        tasas[:, anio] = np.maximum(anterior + velocidad * (tasa_largo_plazo - anterior) + choques[:, anio - 1], 0.0)
+    return tasas
+
+
+# Función para calcular la cuota mensual de cada año de una hipoteca variable de 1 € (trayectorias x años).
+# La cuota se recalcula cada año con el tipo vigente y el capital pendiente. Como el capital es proporcional
+# al precio, la cuota de cualquier vivienda es el precio multiplicado por esta cuota unitaria.
+def cuotas_unitarias(tasas):
+    num_trayectorias, plazo_anos = tasas.shape
+    capital = np.ones(num_trayectorias)
+    cuotas = np.empty_like(tasas)
+    for anio in range(plazo_anos):
+        tasa_mensual = tasas[:, anio] / 12 / 100
+        meses_restantes = (plazo_anos - anio) * 12
+        factor = (1 + tasa_mensual) ** meses_restantes
+        con_interes = tasa_mensual > 0
+        cuota = np.where(
+            con_interes,
+            capital * tasa_mensual * factor / np.where(con_interes, factor - 1, 1.0),
+            capital / meses_restantes
+        )
+        cuotas[:, anio] = cuota
+
+        # Capital pendiente tras los 12 pagos del año
+        factor_anual = (1 + tasa_mensual) ** 12
+        pagado = np.where(con_interes, cuota * (factor_anual - 1) / np.where(con_interes, tasa_mensual, 1.0), cuota * 12)
+        capital = np.maximum(capital * factor_anual - pagado, 0.0)
+    return cuotas
+
+
+# Función que simula un bloque de trayectorias y cuenta, para cada zona e ingreso, cuántas superan cada umbral
+def contar_superaciones(precios, ingresos, num_trayectorias, semilla, parametros):
+    tasas = generar_trayectorias(num_trayectorias, semilla=semilla, **parametros)
+    cuota_maxima = cuotas_unitarias(tasas).max(axis=1)
+
+    # Porcentaje de los ingresos que supone la cuota más alta de toda la vida de la hipoteca
+    # (zonas x ingresos x trayectorias), calculado con broadcasting
+    porcentaje = (precios[:, None, None] * cuota_maxima[None, None, :] * 12
+                  / ingresos[None, :, None] * 100)
+    return np.stack([
+        (porcentaje >= UMBRAL_VIABLE).sum(axis=2),
+        (porcentaje >= UMBRAL_MODERADO).sum(axis=2),
+    ], axis=-1)
+
+
+# Función para estimar la probabilidad de que la hipoteca supere el 30% y el 50% de los ingresos
+# (zonas x ingresos x 2) bajo trayectorias simuladas de tipos de interés
+def probabilidad_superacion(precios, ingresos, num_trayectorias=NUM_TRAYECTORIAS, semilla=SEMILLA, procesos=None,
+                            **parametros):
+    precios = np.asarray(precios, dtype=float)
+    ingresos = np.atleast_1d(np.asarray(ingresos, dtype=float))
+
+    # Cada bloque tiene su propia semilla derivada, así el resultado no depende de cómo se repartan
+    bloques = [min(TAMANO_BLOQUE, num_trayectorias - inicio) for inicio in range(0, num_trayectorias, TAMANO_BLOQUE)]
+    semillas = np.random.SeedSequence(semilla).spawn(len(bloques))
+    argumentos = [(precios, ingresos, tamano, semilla_bloque, parametros) for tamano, semilla_bloque in zip(bloques, semillas)]
+
+    en_paralelo = len(bloques) > 1 and precios.size * ingresos.size * num_trayectorias >= ELEMENTOS_PARALELO
+    if en_paralelo:
+        with ProcessPoolExecutor(max_workers=procesos or os.cpu_count()) as pool:
+            conteos = list(pool.map(contar_superaciones, *zip(*argumentos)))
+    else:
+        conteos = [contar_superaciones(*argumento) for argumento in argumentos]
+    return sum(conteos) / num_trayectorias
+
+
+# Función para calcular el riesgo por zona para unos ingresos a partir del dataset de una provincia
+def riesgo_por_zona(df, ingresos, **opciones):
+    precios = df.groupby('Ciudad')['Valor medio de compra'].mean().dropna()
+    probabilidades = probabilidad_superacion(precios.to_numpy(), [ingresos], **opciones)[:, 0, :]
+    return pd.DataFrame({
+        'Ciudad': precios.index,
+        'Valor medio de compra': precios.to_numpy(),
+        f'Prob. > {UMBRAL_VIABLE}% ingresos': probabilidades[:, 0] * 100,
+        f'Prob. > {UMBRAL_MODERADO}% ingresos': probabilidades[:, 1] * 100,
+    }).sort_values(f'Prob. > {UMBRAL_MODERADO}% ingresos').reset_index(drop=True)
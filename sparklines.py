@@ -0,0 +1,60 @@
+import numpy as np
+
+from graficos import formatear_numero
+
+# Tamaño de las mini-gráficas de tendencia (en píxeles)
+ANCHO_SPARKLINE = 120
+ALTO_SPARKLINE = 30
+MARGEN_SPARKLINE = 2
+
+
+# Función para generar en un solo paso las mini-gráficas SVG de la evolución del precio por m² de cada zona
+def generar_sparklines(df):
+    serie = df.pivot_table(index='Ciudad', columns='Año', values='Precio medio/m²', aggfunc='mean').sort_index(axis=1)
+    valores = serie.to_numpy(dtype=float)
+    if valores.size == 0:
+        return {}
+
+    # Escalar todas las series a la vez al tamaño de la mini-gráfica
+    minimo = np.nanmin(valores, axis=1, keepdims=True)
+    maximo = np.nanmax(valores, axis=1, keepdims=True)
+    rango = np.where(maximo > minimo, maximo - minimo, 1.0)
+    x = np.linspace(MARGEN_SPARKLINE, ANCHO_SPARKLINE - MARGEN_SPARKLINE, valores.shape[1])
+    y = ALTO_SPARKLINE - MARGEN_SPARKLINE - (valores - minimo) / rango * (ALTO_SPARKLINE - 2 * MARGEN_SPARKLINE)
+    x_texto = np.char.mod('%.0f', x)
+    y_texto = np.char.mod('%.0f', np.nan_to_num(y))
+
+    sparklines = {}
+    for fila, zona in enumerate(serie.index):
+        validos = ~np.isnan(valores[fila])
+        puntos = ' '.join(f'{px},{py}' for px, py in zip(x_texto[validos], y_texto[fila][validos]))
+        sparklines[zona] = (
+            f'<svg width="{ANCHO_SPARKLINE}" height="{ALTO_SPARKLINE}" xmlns="http://www.w3.org/2000/svg">'
+            f'<polyline points="{puntos}" fill="none" stroke="#3D5A80" stroke-width="1.5"/></svg>'
+        )
+    return sparklines
+
+
+# Función para generar el detalle (mini-gráfica e indicadores clave) que se muestra en el tooltip de cada zona
+def detalles_zonas(df):
+    sparklines = generar_sparklines(df)
+    indicadores = df.groupby('Ciudad').agg({
+        'Precio medio/m²': 'mean',
+        'Valor medio de compra': 'mean',
+        'Proyección 5 años (%)': 'mean',
+    })
+    ultimo_anio = df[df['Año'] == df['Año'].max()].groupby('Ciudad')['Variación anual (%)'].mean()
+    primer_anio, ultimo = df['Año'].min(), df['Año'].max()
+
+    detalles = {}
+    for zona, fila in indicadores.iterrows():
+        variacion = ultimo_anio.get(zona, np.nan)
+        detalles[zona] = (
+            f'{sparklines.get(zona, "")}<br>'
+            f'<small>Precio medio/m² ({primer_anio}-{ultimo})</small><br>'
+            f'Precio medio/m²: {formatear_numero(fila["Precio medio/m²"])} €/m²<br>'
+            f'Valor medio de compra: {formatear_numero(fila["Valor medio de compra"])} €<br>'
+            f'Proyección 5 años: {formatear_numero(fila["Proyección 5 años (%)"])} %'
+            + ('' if np.isnan(variacion) else f'<br>Variación anual {ultimo}: {formatear_numero(variacion)} %')
+        )
+    return detalles
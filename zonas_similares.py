@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from datos import PLAZO_ANIOS, TASA_INTERES, calcular_hipoteca, codigos_viabilidad
+
+# Características con las que se mide la similitud entre zonas y peso de cada una en la distancia.
+# La ubicación (latitud y longitud) pesa en conjunto lo mismo que cada uno de los indicadores de precio.
+PESOS_SIMILITUD = {
+    'Precio medio/m²': 1.0,
+    'Valor medio de compra': 1.0,
+    'Variación anual (%)': 1.0,
+    'Proyección 5 años (%)': 1.0,
+    'Latitud': 0.5,
+    'Longitud': 0.5,
+}
+INDICADORES_SIMILITUD = ['Precio medio/m²', 'Valor medio de compra', 'Variación anual (%)', 'Proyección 5 años (%)']
+
+# Número de alternativas similares que se muestran
+NUM_ALTERNATIVAS = 5
+
+
+# Función para construir el índice de similitud: por cada tipo de vivienda, una matriz con las características
+# normalizadas de cada zona (media de todos los años), ya escalada por los pesos para que la búsqueda de
+# vecinos sea una distancia euclídea directa
+def construir_indice_similitud(df):
+    agregados = df.groupby(['Tipo de vivienda', 'Ciudad'])[list(PESOS_SIMILITUD)].mean().reset_index()
+
+    # Los indicadores se tipifican (media 0, desviación 1); los que faltan quedan en la media
+    matriz = agregados[INDICADORES_SIMILITUD].to_numpy(dtype=float)
+    desviacion = np.nanstd(matriz, axis=0)
+    matriz = (matriz - np.nanmean(matriz, axis=0)) / np.where(desviacion > 0, desviacion, 1.0)
+
+    # La ubicación se proyecta a coordenadas planas y se escala con una única desviación para no deformar
+    # las distancias entre zonas
+    latitud = agregados['Latitud'].to_numpy(dtype=float)
+    longitud = agregados['Longitud'].to_numpy(dtype=float) * np.cos(np.radians(np.nanmean(latitud)))
+    ubicacion = np.column_stack([latitud, longitud])
+    ubicacion = ubicacion - np.nanmean(ubicacion, axis=0)
+    escala = np.sqrt(np.nanmean(ubicacion ** 2)) if np.isfinite(ubicacion).any() else 0.0
+    ubicacion = ubicacion / (escala if escala > 0 else 1.0)
+
+    matriz = np.nan_to_num(np.column_stack([matriz, ubicacion]))
+    matriz *= np.sqrt(np.array(list(PESOS_SIMILITUD.values())))
+
+    indice = {}
+    for tipo_vivienda, filas in agregados.groupby('Tipo de vivienda').indices.items():
+        indice[tipo_vivienda] = {
+            'zonas': agregados.iloc[filas].reset_index(drop=True),
+            'matriz': matriz[filas],
+        }
+    return indice
+
+
+# Función para buscar las zonas más parecidas a una dada que sí son viables (hipoteca por debajo del 30%
+# de los ingresos) para el mismo tipo de vivienda
+def buscar_similares(indice, zona, tipo_vivienda, ingresos, k=NUM_ALTERNATIVAS):
+    columnas = ['Ciudad'] + INDICADORES_SIMILITUD + ['Hipoteca mensual', 'Porcentaje de ingresos', 'Similitud']
+    entrada = indice.get(tipo_vivienda)
+    if entrada is None:
+        return pd.DataFrame(columns=columnas)
+    zonas = entrada['zonas']
+    posicion = np.flatnonzero(zonas['Ciudad'].to_numpy() == zona)
+    if not posicion.size:
+        return pd.DataFrame(columns=columnas)
+
+    matriz = entrada['matriz']
+    distancias = np.sqrt(((matriz - matriz[posicion[0]]) ** 2).sum(axis=1))
+    hipotecas = calcular_hipoteca(zonas['Valor medio de compra'].to_numpy(dtype=float), TASA_INTERES, PLAZO_ANIOS)
+    candidatas = codigos_viabilidad(hipotecas, ingresos) == 1
+    candidatas[posicion[0]] = False
+    candidatas = np.flatnonzero(candidatas)
+
+    # Solo se ordenan las k más cercanas
+    if candidatas.size > k:
+        candidatas = candidatas[np.argpartition(distancias[candidatas], k)[:k]]
+    candidatas = candidatas[np.argsort(distancias[candidatas], kind='stable')]
+
+    similares = zonas.iloc[candidatas][['Ciudad'] + INDICADORES_SIMILITUD].reset_index(drop=True)
+    similares['Hipoteca mensual'] = hipotecas[candidatas]
+    similares['Porcentaje de ingresos'] = hipotecas[candidatas] * 12 / ingresos * 100
+    # Similitud entre 0 y 100 (100 = mismas características)
+    similares['Similitud'] = 100 / (1 + distancias[candidatas])
+    return similares